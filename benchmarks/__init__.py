@@ -0,0 +1 @@
+"""ScopeHunter benchmarks."""
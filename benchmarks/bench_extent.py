@@ -0,0 +1,137 @@
+"""
+Scope extent benchmark.
+
+Compares finding the extent of the scope under the cursor by searching the
+whole file with `find_by_selector` against expanding locally around the
+cursor with `find_extent`, on a large synthetic buffer.  When the extent
+is only needed for the highlight, the local search is capped to the
+highlight's max size, and never falls back to searching the whole file.
+
+The test suite's fake view stands in for Sublime's API: `find_by_selector`
+checks every token in the file, and `match_selector` checks a single
+character.  As each call to Sublime's API has a fixed cost of its own, the
+number of calls per lookup is reported along with the time.
+
+Run from the repository root:
+
+```
+python -m benchmarks.bench_extent [lines] [window] [highlight_max_size]
+```
+"""
+from __future__ import print_function
+import random
+import sys
+import time
+from lib.scope_extent import find_extent
+from tests.fake_view import View
+
+BASE = 'source.python'
+LINE_TOKENS = (
+    ('    ', BASE),
+    ('value_%d', BASE + ' variable.other.python'),
+    (' ', BASE),
+    ('=', BASE + ' keyword.operator.assignment.python'),
+    (' ', BASE),
+    ('call_%d', BASE + ' meta.function-call.python variable.function.python'),
+    ('(', BASE + ' meta.function-call.python punctuation.section.arguments.begin.python'),
+    ('"', BASE + ' meta.function-call.python string.quoted.double.python punctuation.definition.string.begin.python'),
+    ('string %d', BASE + ' meta.function-call.python string.quoted.double.python'),
+    ('\\n', BASE + ' meta.function-call.python string.quoted.double.python constant.character.escape.python'),
+    ('"', BASE + ' meta.function-call.python string.quoted.double.python punctuation.definition.string.end.python'),
+    (')', BASE + ' meta.function-call.python punctuation.section.arguments.end.python'),
+    ('  ', BASE),
+    ('# comment %d', BASE + ' comment.line.number-sign.python'),
+    ('\n', BASE)
+)
+
+
+def make_view(lines):
+    """Create a view of generated Python code."""
+
+    tokens = []
+    for i in range(lines):
+        for text, scope in LINE_TOKENS:
+            tokens.append((text % i if '%d' in text else text, scope + ' '))
+    return View(tokens)
+
+
+def search_file(view, pt, selector):
+    """Find the extent by searching the whole file."""
+
+    file_end = view.size()
+    for r in view.find_by_selector(selector):
+        if r.contains(pt) or (pt == file_end and r.end() == pt):
+            return r.begin(), r.end()
+    return pt, pt
+
+
+def search_local(view, pt, selector, window):
+    """Find the extent locally, searching the whole file if the extent reaches the window."""
+
+    extent = find_extent(view, pt, selector, window)
+    if extent is None:
+        extent = search_file(view, pt, selector)
+    return extent
+
+
+def search_highlight(view, pt, selector, max_size):
+    """Find the extent to highlight locally, giving up if it reaches the highlight's max size."""
+
+    extent = find_extent(view, pt, selector, max_size)
+    if extent is None:
+        extent = pt, pt
+    return extent
+
+
+def measure(view, points, func, *args):
+    """Time each extent lookup and count the API calls it makes."""
+
+    extents = []
+    times = []
+    calls = []
+    for pt in points:
+        selector = view.scope_name(pt)
+        view.calls.clear()
+        start = time.perf_counter()
+        extents.append(func(view, pt, selector, *args))
+        times.append(time.perf_counter() - start)
+        calls.append(sum(view.calls.values()))
+    return extents, times, calls
+
+
+def median(values):
+    """Get the median of the values."""
+
+    return sorted(values)[len(values) // 2]
+
+
+def main(argv):
+    """Run the benchmark."""
+
+    line_count = int(argv[1]) if len(argv) > 1 else 50000
+    window = int(argv[2]) if len(argv) > 2 else 2000
+    max_size = int(argv[3]) if len(argv) > 3 else 100
+    view = make_view(line_count)
+    rand = random.Random(0)
+    points = [rand.randrange(view.size()) for _ in range(50)]
+
+    whole, whole_times, whole_calls = measure(view, points, search_file)
+    local, local_times, local_calls = measure(view, points, search_local, window)
+    highlight, highlight_times, highlight_calls = measure(view, points, search_highlight, max_size)
+    assert whole == local
+    assert all(h == w for h, w in zip(highlight, whole) if w[1] - w[0] < max_size)
+    fallbacks = sum(1 for begin, end in whole if end - begin > window)
+
+    print('%d lines, %d characters, %d character window' % (line_count, view.size(), window))
+    print('%d of %d extents reached the window' % (fallbacks, len(points)))
+    print('%-10s %14s %14s %14s' % ('', 'median ms', 'max ms', 'median calls'))
+    for name, times, calls in (
+        ('file', whole_times, whole_calls),
+        ('local', local_times, local_calls),
+        ('highlight', highlight_times, highlight_calls)
+    ):
+        print('%-10s %14.3f %14.3f %14d' % (name, median(times) * 1000, max(times) * 1000, median(calls)))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
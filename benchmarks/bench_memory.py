@@ -0,0 +1,181 @@
+"""
+Memory benchmark of color scheme rule and match records.
+
+Loads a `ColorSchemeMatcher` from a large generated `.sublime-color-scheme`,
+through the test suite's stand in for the `sublime` module, and matches a long
+session's worth of scopes with it.  The matcher's rules and matches are then
+stored both the old way, as the per-rule and per-scope dictionaries the matcher
+used to keep, and the new way, as its slotted `SchemeRule` and `ScopeMatch`
+records, to compare the memory each storage uses.
+
+The memory kept and the peak memory are traced by `tracemalloc`.  The memory
+of the whole matcher, including its selector index, scope trie, and caches, is
+reported too.
+
+Run from the repository root:
+
+```
+python -m benchmarks.bench_memory [rules] [scopes]
+```
+"""
+from __future__ import print_function
+import json
+import sys
+import tracemalloc
+from lib.scheme_records import ScopeMatch
+from tests.test_override_update import resources, stub_sublime
+
+SCHEME = 'Packages/Bench/Bench.sublime-color-scheme'
+
+
+def make_scheme(count):
+    """Generate a color scheme with the number of rules."""
+
+    rules = []
+    for i in range(count):
+        rule = {
+            'name': 'Rule %d' % i,
+            'scope': 'source.lang%d meta.block%d keyword.control%d' % (i % 50, i % 7, i),
+            'foreground': '#%06x' % (i * 2654435761 % 0xFFFFFF)
+        }
+        if i % 3 == 0:
+            rule['background'] = '#%06x' % (i * 40503 % 0xFFFFFF)
+        if i % 5 == 0:
+            rule['font_style'] = 'bold'
+        rules.append(rule)
+    return {
+        'variables': {},
+        'globals': {'foreground': '#cccccc', 'background': '#222222', 'selection': '#444444'},
+        'rules': rules
+    }
+
+
+def make_scopes(rule_count, count):
+    """Generate scopes, each matching one of the rules."""
+
+    scopes = []
+    for i in range(count):
+        rule = i % rule_count
+        scopes.append(
+            'source.lang%d meta.block%d keyword.control%d.scope%d' % (rule % 50, rule % 7, rule, i)
+        )
+    return scopes
+
+
+def load_matcher(matcher_class, scopes):
+    """Load the matcher, and match every scope with it."""
+
+    matcher = matcher_class(SCHEME, native_scoring=True, cache_size=len(scopes))
+    for rule in matcher.rules:
+        matcher.process_rule(rule)
+    for scope in scopes:
+        matcher.match_scope(scope)
+    return matcher
+
+
+def slotted_rules(matcher):
+    """Build the matcher's rules the new way: one slotted record per rule."""
+
+    records = []
+    for rule in matcher.rules:
+        record = rule.copy()
+        record.selector = type(rule.selector)(rule.name, rule.scope)
+        records.append(record)
+    return records
+
+
+def slotted_matches(matcher, scopes):
+    """Cache the matcher's matches the new way: slotted records of rule ids."""
+
+    matched = {}
+    for scope in scopes:
+        matched[scope] = ScopeMatch.load(matcher.matched.get(scope).dump())
+    return matched
+
+
+def dict_rules(matcher):
+    """Build the matcher's rules the old way: one dictionary per rule."""
+
+    colors = {}
+    for rule in matcher.rules:
+        colors[rule.scope] = {
+            "name": rule.name,
+            "scope": rule.scope,
+            "color": rule.color,
+            "color_simulated": rule.color_simulated,
+            "color_gradient": rule.color_gradient,
+            "bgcolor": rule.bgcolor,
+            "bgcolor_simulated": rule.bgcolor_simulated,
+            "selection_color": rule.selection_color,
+            "selection_color_simulated": rule.selection_color_simulated,
+            "style": rule.style
+        }
+    return colors
+
+
+def dict_matches(results):
+    """Cache the matched colors the old way: nested dictionaries with new selector tuples."""
+
+    matched = {}
+    for scope, colors in results:
+        matched[scope] = {
+            "color": colors.fg,
+            "bgcolor": colors.bg,
+            "scolor": None,
+            "color_simulated": colors.fg_simulated,
+            "bgcolor_simulated": colors.bg_simulated,
+            "scolor_simulated": None,
+            "color_gradient": colors.color_gradient,
+            "style": colors.style,
+            "selectors": {
+                "color": type(colors.fg_selector)(*colors.fg_selector),
+                "background": type(colors.bg_selector)(*colors.bg_selector),
+                "scolor": type(colors.fg_selector)("selection_foreground", "selection_foreground"),
+                "style": {
+                    style: type(selector)(*selector) for style, selector in colors.style_selectors.items()
+                },
+                "color_gradient": None
+            }
+        }
+    return matched
+
+
+def measure(func, *args):
+    """Measure the memory kept by the function's result, and the peak memory while it ran."""
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = func(*args)
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, after - before, peak - before
+
+
+def main(argv):
+    """Run the benchmark."""
+
+    rule_count = int(argv[1]) if len(argv) > 1 else 5000
+    scope_count = int(argv[2]) if len(argv) > 2 else 50000
+    scopes = make_scopes(rule_count, scope_count)
+    resources[SCHEME] = json.dumps(make_scheme(rule_count))
+
+    matcher_class, patch = stub_sublime()
+    try:
+        matcher, matcher_size, matcher_peak = measure(load_matcher, matcher_class, scopes)
+        results = [(scope, matcher.guess_color(scope)) for scope in scopes]
+        sizes = [
+            ('rules', measure(dict_rules, matcher)[1:], measure(slotted_rules, matcher)[1:]),
+            ('matches', measure(dict_matches, results)[1:], measure(slotted_matches, matcher, scopes)[1:])
+        ]
+    finally:
+        patch.stop()
+
+    print('%d rules, %d matched scopes' % (rule_count, scope_count))
+    print('%-10s %14s %14s %14s %14s' % ('', 'dict kept', 'dict peak', 'slotted kept', 'slotted peak'))
+    for name, (dict_size, dict_peak), (slotted_size, slotted_peak) in sizes:
+        print('%-10s %14d %14d %14d %14d' % (name, dict_size, dict_peak, slotted_size, slotted_peak))
+    print('%-10s %14s %14s %14d %14d' % ('matcher', '', '', matcher_size, matcher_peak))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,117 @@
+"""
+Popup template benchmark.
+
+Compares rendering the popup template for a selection the way it used to be
+rendered, loading the template and handing its source to `mdpopups.md2html`,
+which sets up a Jinja environment and parses the template every time, against
+rendering it from the template compiled once by `PopupTemplate`.
+
+Only the template is rendered: the Markdown conversion that follows it in
+Sublime Text is the same either way.
+
+Run from the repository root:
+
+```
+python -m benchmarks.bench_popup [selections]
+```
+"""
+from __future__ import print_function
+import codecs
+import sys
+import time
+import jinja2
+from lib.popup_template import PopupTemplate
+
+OPTIONS = {"trim_blocks": True, "lstrip_blocks": True}
+
+
+def load():
+    """Load the popup template."""
+
+    with codecs.open('popup.j2', 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def make_vars(i):
+    """Generate the template variables of a selection showing every section."""
+
+    box = '<a href=""><img src="data:image/png;base64,%s"></a>' % ('A' * 200)
+    variables = {
+        "scope": "source.python meta.function.python entity.name.function.python",
+        "pt_extent": True,
+        "extent_start": i,
+        "extent_end": i + 10,
+        "rowcol_extent": True,
+        "l_start": i,
+        "l_end": i,
+        "c_start": 1,
+        "c_end": 11,
+        "appearance": True,
+        "fg_hash": True,
+        "bg_sim": True,
+        "style_tag": "b",
+        "style_tag2": "i",
+        "style": "bold italic",
+        "selectors": True,
+        "fg_name": "Function",
+        "fg_scope": "entity.name.function",
+        "bg_name": "Background",
+        "bg_scope": "source",
+        "bold": True,
+        "bold_scope": "entity.name",
+        "italic": True,
+        "italic_scope": "entity",
+        "files": True,
+        "syntax": "Packages/Python/Python.sublime-syntax",
+        "scheme": "Packages/Color Scheme - Default/Monokai.sublime-color-scheme",
+        "overrides": ["Packages/User/Monokai.sublime-color-scheme"]
+    }
+    for index, key in enumerate(
+        (
+            'scope', 'extent_pt', 'line_char', 'fg', 'fg_hash', 'bg', 'bg_sim', 'style', 'fg_name', 'fg_scope',
+            'bg_name', 'bg_scope', 'bold_scope', 'italic_scope', 'syntax', 'scheme', 'overrides'
+        )
+    ):
+        variables['%s_index' % key] = index
+    for key in ('fg', 'fg_hash', 'bg', 'bg_sim'):
+        variables['%s_preview' % key] = box
+        variables['%s_color' % key] = '#F8F8F2'
+    return variables
+
+
+def render_parsed(variables):
+    """Render the way `mdpopups.md2html` did: load the source and parse it in a new environment."""
+
+    return jinja2.Environment(**OPTIONS).from_string(load()).render(plugin=variables)
+
+
+def render_compiled(template, variables):
+    """Render from the compiled template."""
+
+    return template.render(plugin=variables)
+
+
+def main(argv):
+    """Run the benchmark."""
+
+    count = int(argv[1]) if len(argv) > 1 else 500
+    selections = [make_vars(i) for i in range(count)]
+    template = PopupTemplate(load, **OPTIONS)
+
+    start = time.perf_counter()
+    parsed = [render_parsed(variables) for variables in selections]
+    parsed_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    compiled = [render_compiled(template, variables) for variables in selections]
+    compiled_time = time.perf_counter() - start
+    assert parsed == compiled
+
+    print('%d selections' % count)
+    print('%-10s %14s' % ('', 'ms/selection'))
+    print('%-10s %14.3f' % ('parsed', parsed_time * 1000 / count))
+    print('%-10s %14.3f' % ('compiled', compiled_time * 1000 / count))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
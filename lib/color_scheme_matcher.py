@@ -26,15 +26,30 @@ Algorithm has been split out into a separate library and been enhanced with a nu
 from __future__ import absolute_import
 import sublime
 import codecs
+import copy
+import difflib
+import hashlib
+import json
+import os
 import re
 from .file_strip.json import sanitize_json
 from .rgba import RGBA, clamp, round_int
 from . import x11colors
+from .scope_selector import SelectorIndex, ScopeSelector, score_selector
+from .lru_cache import LRUCache
+from .scope_trie import ScopeTrie
+from .result_cache import ResultStore
+from .scheme_records import SchemeRule, ScopeMatch, StyleTable, NO_RULE
 from os import path
 from collections import namedtuple
-from plistlib import readPlistFromBytes
+try:
+    from plistlib import readPlistFromBytes
+except ImportError:
+    from plistlib import loads as readPlistFromBytes  # noqa
 import decimal
 
+CACHE_VERSION = 4
+
 NEW_SCHEMES = int(sublime.version()) >= 3150
 FONT_STYLE = "font_style" if int(sublime.version()) >= 3151 else "fontStyle"
 GLOBAL_OPTIONS = "globals" if int(sublime.version()) >= 3152 else "defaults"
@@ -50,7 +65,7 @@ COLOR_PARTS = {
     "float": r"[+\-]?(?:(?:\d*\.\d+)|\d+)"
 }
 
-RGB_COLORS = r"""(?x)
+RGB_COLORS = r"""
     (?P<hexa>\#(?P<hexa_content>[\dA-Fa-f]{8}))\b |
     (?P<hex>\#(?P<hex_content>[\dA-Fa-f]{6}))\b |
     (?P<hexa_compressed>\#(?P<hexa_compressed_content>[\dA-Fa-f]{4}))\b |
@@ -61,16 +76,18 @@ RGB_COLORS = r"""(?x)
     )\s*\))
 """ % COLOR_PARTS
 
-HSL_COLORS = r"""(?x)
+HSL_COLORS = r"""
     \b(?P<hsl>hsl\(\s*(?P<hsl_content>%(float)s\s*,\s*%(percent)s\s*,\s*%(percent)s)\s*\)) |
     \b(?P<hsla>hsla\(\s*(?P<hsla_content>%(float)s\s*,\s*(?:%(percent)s\s*,\s*){2}(?:%(percent)s|%(float)s))\s*\))
 """ % COLOR_PARTS
 
-VARIABLES = r"""(?x)
+VARIABLES = r"""
     \b(?P<var>var\(\s*(?P<var_content>[-\w][-\w\d]*)\s*\))
 """
 
-COLOR_MOD = r"""(?x)
+VARIABLE_REF_RE = re.compile(r'\bvar\(\s*(?P<name>[-\w][-\w\d]*)\s*\)')
+
+COLOR_MOD = r"""
     \b(?P<color>color\((?P<color_content>.*)\))
 """
 
@@ -304,6 +321,12 @@ def translate_color(m, var, var_src):
     return color
 
 
+def is_color(color):
+    """Check if the value is a color that `process_color` can handle."""
+
+    return color is not None and color.strip() != "" and color.startswith('#')
+
+
 def sublime_format_path(pth):
     """Format path for sublime internal use."""
 
@@ -319,52 +342,155 @@ class SchemeColors(
         [
             'fg', 'fg_simulated', 'bg', "bg_simulated", "style", "color_gradient",
             "fg_selector", "bg_selector", "style_selectors", "color_gradient_selector"
-        ],
-        verbose=False
+        ]
     )
 ):
     """SchemeColors."""
 
 
-class SchemeSelectors(namedtuple('SchemeSelectors', ['name', 'scope'], verbose=False)):
+class SchemeSelectors(namedtuple('SchemeSelectors', ['name', 'scope'])):
     """SchemeSelectors."""
 
 
+# Default selectors are immutable, so they are shared by all matches.
+FG_SELECTOR = SchemeSelectors("foreground", "foreground")
+BG_SELECTOR = SchemeSelectors("background", "background")
+SFG_SELECTOR = SchemeSelectors("selection_foreground", "selection_foreground")
+SELECTION_SELECTOR = SchemeSelectors("selection", "selection")
+NO_SELECTOR = SchemeSelectors("", "")
+
+# Source of rules that did not come from an override scheme.
+NO_SOURCE = -1
+
+
 class ColorSchemeMatcher(object):
     """Determine color scheme colors and style for text in a Sublime view buffer."""
 
-    def __init__(self, scheme_file, color_filter=None):
-        """Initialize."""
+    def __init__(
+        self, scheme_file, color_filter=None, native_scoring=False, cache_size=5000,
+        cache_dir=None, persist_results=False
+    ):
+        """
+        Initialize.
+
+        If a cache directory is given, the resolved scheme is saved there and reused
+        until the scheme or its overrides change.  If `persist_results` is also enabled,
+        the colors and styles resolved for scopes are saved there as well and reused
+        across sessions.  Schemes processed with a custom color filter are never cached.
+        """
+        use_cache = cache_dir is not None and color_filter is None
+        self.incremental = color_filter is None
         if color_filter is None:
             color_filter = self.filter
         self.color_scheme = scheme_file.replace('\\', '/')
         self.scheme_file = path.basename(self.color_scheme)
 
+        content = None
         if NEW_SCHEMES and scheme_file.endswith(('.sublime-color-scheme', '.hidden-color-scheme')):
             self.legacy = False
-            self.scheme_obj = {
-                'variables': {},
-                GLOBAL_OPTIONS: {},
-                'rules': []
-            }
         else:
-            try:
-                content = sublime.load_binary_resource(sublime_format_path(self.color_scheme))
-            except IOError:
-                # Fallback if file was created manually and not yet found in resources
-                with open(packages_path(self.color_scheme), 'rb') as f:
-                    content = f.read()
+            content = self.load_legacy()
             self.legacy = True
-            self.convert_format(readPlistFromBytes(XML_COMMENT_RE.sub(b'', content)))
         self.overrides = []
-        if NEW_SCHEMES:
-            self.merge_overrides()
+        self.sources = []
+        sources = self.load_overrides() if NEW_SCHEMES else []
         self.scheme_file = scheme_file
-        self.matched = {}
+        self.native_scoring = native_scoring
+        self.matched = LRUCache(cache_size)
+        self.styles = StyleTable()
         self.variables = {}
-        self.parse_scheme()
-        self.scheme_obj = color_filter(self.scheme_obj)
-        self.setup_matcher()
+        self.content_hash = hashlib.sha1(content).digest() if content is not None else None
+        self.scheme_hash = self.hash_sources(sources)
+        self.cache_file = None
+        self.results = None
+        if use_cache:
+            name = hashlib.sha1(self.color_scheme.encode('utf-8')).hexdigest()
+            self.cache_file = path.join(cache_dir, 'scheme-%s.json' % name)
+            if persist_results:
+                self.results = ResultStore(
+                    path.join(cache_dir, 'results-%s.jsonl' % name),
+                    self.scheme_hash + (':native' if native_scoring else '')
+                )
+
+        if self.load_cache():
+            self.overrides = [override for override, text in sources]
+            self.sources = sources
+            self.setup_index()
+        else:
+            if self.legacy:
+                self.convert_format(readPlistFromBytes(XML_COMMENT_RE.sub(b'', content)))
+            else:
+                self.scheme_obj = {
+                    'variables': {},
+                    GLOBAL_OPTIONS: {},
+                    'rules': []
+                }
+            self.rule_sources = [NO_SOURCE] * len(self.scheme_obj['rules'])
+            if NEW_SCHEMES:
+                self.merge_overrides(sources)
+            self.parse_scheme()
+            self.scheme_obj = color_filter(self.scheme_obj)
+            self.setup_matcher()
+            self.save_cache()
+
+    def hash_sources(self, sources):
+        """Hash the scheme path, the legacy scheme content, and the override names and content."""
+
+        h = hashlib.sha1()
+        h.update(('%d\n%s\n%s\n' % (CACHE_VERSION, sublime.version(), self.color_scheme)).encode('utf-8'))
+        if self.content_hash is not None:
+            h.update(self.content_hash)
+        for override, text in sources:
+            h.update(override.encode('utf-8'))
+            h.update(hashlib.sha1(text.encode('utf-8')).digest())
+        return h.hexdigest()
+
+    def load_cache(self):
+        """Load the resolved scheme from the cache if it is still valid."""
+
+        if self.cache_file is None:
+            return False
+
+        try:
+            with codecs.open(self.cache_file, 'r', encoding='utf-8') as f:
+                cache = json.load(f)
+            if cache.get('key') != self.scheme_hash:
+                return False
+            self.scheme_obj = cache['scheme_obj']
+            self.variables = cache['variables']
+            self.special_colors = cache['special_colors']
+            self.rules = [SchemeRule.load(data) for data in cache['rules']]
+            self.rule_ids = {rule.scope: rule.rule_id for rule in self.rules}
+            self.rule_sources = cache['rule_sources']
+        except Exception:
+            return False
+        return True
+
+    def save_cache(self):
+        """Save the resolved scheme to the cache."""
+
+        if self.cache_file is None:
+            return
+
+        cache = {
+            'key': self.scheme_hash,
+            'scheme_obj': self.scheme_obj,
+            'variables': self.variables,
+            'special_colors': self.special_colors,
+            'rules': [rule.dump() for rule in self.rules],
+            'rule_sources': self.rule_sources
+        }
+        try:
+            cache_dir = path.dirname(self.cache_file)
+            if not path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            # Write to a temporary file first so an interrupted write never leaves a partial cache.
+            tmp = self.cache_file + '.tmp'
+            with codecs.open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(cache, f)
+            os.replace(tmp, self.cache_file)
+        except Exception:
+            pass
 
     def convert_format(self, obj):
         """Convert tmTheme object to new format."""
@@ -406,29 +532,67 @@ class ColorSchemeMatcher(object):
                     rule[FONT_STYLE] = font_style
                 self.scheme_obj['rules'].append(rule)
 
-    def merge_overrides(self):
-        """Merge override schemes."""
+    def load_legacy(self):
+        """Load the legacy scheme's content."""
+
+        try:
+            content = sublime.load_binary_resource(sublime_format_path(self.color_scheme))
+        except IOError:
+            # Fallback if file was created manually and not yet found in resources
+            with open(packages_path(self.color_scheme), 'rb') as f:
+                content = f.read()
+        return content
+
+    def load_overrides(self):
+        """Load the override schemes' content."""
 
+        sources = []
         package_overrides = []
         user_overrides = []
         if self.scheme_file.endswith('.hidden-color-scheme'):
             pattern = '%s.hidden-color-scheme'
         else:
             pattern = '%s.sublime-color-scheme'
-        for override in sublime.find_resources(pattern % path.splitext(self.scheme_file)[0]):
+        for override in sublime.find_resources(pattern % path.splitext(path.basename(self.scheme_file))[0]):
             if override.startswith('Packages/User/'):
                 user_overrides.append(override)
             else:
                 package_overrides.append(override)
         for override in (package_overrides + user_overrides):
-            try:
-                ojson = sublime.decode_value(sublime.load_resource(override))
-            except IOError:
-                # Fallback if file was created manually and not yet found in resources
-                # Though it is unlikely this would ever get executed as `find_resources`
-                # probably wouldn't have seen it either.
-                with codecs.open(packages_path(override), 'r', encoding='utf-8') as f:
-                    ojson = sublime.decode_value(sanitize_json(f.read()))
+            sources.append((override, self.load_override(override)))
+
+        # Rare case of being given a file but sublime hasn't indexed the files and can't find it
+        if (
+            not sources and
+            self.color_scheme.endswith(('.sublime-color-scheme', '.hidden-color-scheme')) and
+            self.color_scheme.startswith('Packages/')
+        ):
+            with codecs.open(packages_path(self.color_scheme), 'r', encoding='utf-8') as f:
+                sources.append((self.color_scheme, sanitize_json(f.read())))
+
+        return sources
+
+    def load_override(self, override):
+        """Load an override scheme's content."""
+
+        try:
+            text = sublime.load_resource(override)
+        except IOError:
+            # Fallback if file was created manually and not yet found in resources
+            # Though it is unlikely this would ever get executed as `find_resources`
+            # probably wouldn't have seen it either.
+            with codecs.open(packages_path(override), 'r', encoding='utf-8') as f:
+                text = sanitize_json(f.read())
+        return text
+
+    def merge_overrides(self, sources=None):
+        """Merge override schemes."""
+
+        if sources is None:
+            sources = self.load_overrides()
+
+        for override, text in sources:
+            ojson = sublime.decode_value(text)
 
             for k, v in ojson.get('variables', {}).items():
                 self.scheme_obj['variables'][k] = v
@@ -438,45 +602,247 @@ class ColorSchemeMatcher(object):
 
             for item in ojson.get('rules', []):
                 self.scheme_obj['rules'].append(item)
+                self.rule_sources.append(len(self.overrides))
 
             self.overrides.append(override)
+            self.sources.append((override, text))
 
-        # Rare case of being given a file but sublime hasn't indexed the files and can't find it
-        if (
-            not self.overrides and
-            self.color_scheme.endswith(('.sublime-color-scheme', '.hidden-color-scheme')) and
-            self.color_scheme.startswith('Packages/')
-        ):
-            with codecs.open(packages_path(self.color_scheme), 'r', encoding='utf-8') as f:
-                ojson = sublime.decode_value(sanitize_json(f.read()))
+    def update_overrides(self, override=None):
+        """
+        Get a matcher that is updated with the changes to the override schemes.
+
+        Only the changed overrides are merged again, and only the variables and
+        rules they affect are recomputed.  Matched scopes are only discarded if
+        a changed rule could match them.  If `override` is given, only that
+        override is read again, otherwise all overrides are checked for changes.
+
+        The matcher itself is never modified, so it can keep being used while
+        the update is done.  If nothing changed, the matcher itself is returned,
+        otherwise an updated copy is returned.  `None` is returned if the matcher
+        can't be updated and must be created again: the legacy scheme changed,
+        overrides were added or removed, global options changed, or the scheme
+        was processed with a custom color filter.
+        """
 
-                for k, v in ojson.get('variables', {}).items():
-                    self.scheme_obj['variables'][k] = v
+        if not self.incremental:
+            return None
 
-                for k, v in ojson.get(GLOBAL_OPTIONS, {}).items():
-                    self.scheme_obj[GLOBAL_OPTIONS][k] = v
+        if self.legacy and override is None:
+            if hashlib.sha1(self.load_legacy()).digest() != self.content_hash:
+                return None
 
-                for item in ojson.get('rules', []):
-                    self.scheme_obj['rules'].append(item)
+        if not NEW_SCHEMES:
+            return self
 
-                self.overrides.append(self.color_scheme)
+        if override is not None:
+            if override not in self.overrides:
+                return None
+            index = self.overrides.index(override)
+            try:
+                text = self.load_override(override)
+            except IOError:
+                # The override was removed.
+                return None
+            changed = [(index, text)] if text != self.sources[index][1] else []
+        else:
+            sources = self.load_overrides()
+            if [name for name, text in sources] != self.overrides:
+                return None
+            changed = [
+                (index, text) for index, (name, text) in enumerate(sources) if text != self.sources[index][1]
+            ]
+
+        if not changed:
+            return self
+
+        matcher = copy.copy(self)
+        matcher.sources = list(self.sources)
+        matcher.scheme_obj = dict(self.scheme_obj)
+        for index, text in changed:
+            if not matcher.update_override(index, text):
+                return None
+
+        matcher.scheme_hash = matcher.hash_sources(matcher.sources)
+        if matcher.results is not None:
+            matcher.results = ResultStore(
+                matcher.results.filename,
+                matcher.scheme_hash + (':native' if matcher.native_scoring else '')
+            )
+        matcher.save_cache()
+        return matcher
+
+    def update_override(self, index, text):
+        """
+        Merge the new content of the override at the given index.
+
+        Containers shared with the matcher this one was copied from are replaced, not modified.
+        """
+
+        decoded = [
+            sublime.decode_value(text if i == index else source)
+            for i, (name, source) in enumerate(self.sources)
+        ]
+        old = sublime.decode_value(self.sources[index][1])
+        new = decoded[index]
+        if old.get(GLOBAL_OPTIONS, {}) != new.get(GLOBAL_OPTIONS, {}):
+            return False
+
+        # Resolve the variables again and find the ones whose color changed.
+        raw_variables = {}
+        raw_globals = {}
+        for ojson in decoded:
+            raw_variables.update(ojson.get('variables', {}))
+            raw_globals.update(ojson.get(GLOBAL_OPTIONS, {}))
+        variables = self.resolve_variables(raw_variables)
+        affected = set(
+            k for k in set(variables) | set(self.variables) if variables.get(k) != self.variables.get(k)
+        )
+        if affected and any(self.uses_variables(v, affected) for v in raw_globals.values()):
+            return False
+
+        # Replace the override's rules that were edited, and resolve again the rules that use changed variables.
+        # Rules that were not edited keep their order, so `SequenceMatcher` is used to find them.
+        groups = {}
+        for item, source in zip(self.scheme_obj['rules'], self.rule_sources):
+            groups.setdefault(source, []).append(item)
+        old_group = groups.get(index, [])
+        rules = new.get('rules', [])
+        changed = set()
+        group = []
+        matcher = difflib.SequenceMatcher(
+            None,
+            [json.dumps(item, sort_keys=True) for item in old.get('rules', [])],
+            [json.dumps(item, sort_keys=True) for item in rules],
+            autojunk=False
+        )
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+            if tag == 'equal':
+                for old_item, item in zip(old_group[i1:i2], rules[j1:j2]):
+                    if affected and self.uses_rule_variables(item, affected):
+                        old_item = self.resolve_rule(item, variables)
+                        changed.add(item.get('scope'))
+                    group.append(old_item)
+            else:
+                changed.update(item.get('scope') for item in old_group[i1:i2])
+                for item in rules[j1:j2]:
+                    group.append(self.resolve_rule(item, variables))
+                    changed.add(item.get('scope'))
+        groups[index] = group
+        if affected:
+            for source, ojson in enumerate(decoded):
+                if source == index:
+                    continue
+                group = groups.setdefault(source, [])
+                for i, item in enumerate(ojson.get('rules', [])):
+                    if self.uses_rule_variables(item, affected):
+                        group[i] = self.resolve_rule(item, variables)
+                        changed.add(item.get('scope'))
+        changed.discard(None)
+
+        self.variables = variables
+        self.scheme_obj['variables'] = raw_variables
+        self.scheme_obj['rules'] = []
+        self.rule_sources = []
+        for source in [NO_SOURCE] + list(range(len(self.sources))):
+            group = groups.get(source, [])
+            self.scheme_obj['rules'].extend(group)
+            self.rule_sources.extend([source] * len(group))
+        self.sources[index] = (self.sources[index][0], text)
+
+        # Rules not affected by the change keep their processed colors.
+        # Their order is also unchanged, so only their ids need updating.
+        old_rules = self.rules
+        old_ids = self.rule_ids
+        self.build_rules()
+        remap = {}
+        for rule in self.rules:
+            old_id = old_ids.get(rule.scope)
+            if old_id is not None and rule.scope not in changed:
+                old_rule = old_rules[old_id].copy()
+                old_rule.rule_id = rule.rule_id
+                self.rules[rule.rule_id] = old_rule
+                remap[old_id] = rule.rule_id
+        self.setup_index()
+
+        # Only scopes that a changed rule could match can have different winners.
+        changed = sorted(changed)
+        changed_index = SelectorIndex()
+        for i, scope in enumerate(changed):
+            changed_index.add(i, scope)
+        old_matched = self.matched
+        self.matched = LRUCache(old_matched.maxsize)
+        for scope_key, matched in old_matched.items():
+            elements = scope_key.split()
+            for i in changed_index.candidates(scope_key):
+                if self.score_scope(scope_key, elements, changed[i]):
+                    break
+            else:
+                matched = ScopeMatch.load(matched.dump())
+                matched.remap(remap)
+                self.matched.set(scope_key, matched)
+        return True
+
+    def uses_rule_variables(self, item, names):
+        """Check if any of the rule's colors use one of the variables."""
+
+        return any(
+            self.uses_variables(item.get(key), names)
+            for key in ('foreground', 'background', 'selection_foreground')
+        )
+
+    def uses_variables(self, color, names):
+        """Check if the color, or any color in a color list, uses one of the variables."""
+
+        if isinstance(color, list):
+            return any(self.uses_variables(c, names) for c in color)
+        if isinstance(color, str):
+            return any(m.group('name') in names for m in VARIABLE_REF_RE.finditer(color))
+        return False
 
     def filter(self, scheme):
         """Dummy filter call that does nothing."""
 
         return scheme
 
-    def parse_scheme(self):
-        """Parse the color scheme."""
+    def resolve_variables(self, variables):
+        """Resolve the colors of the variables in place, and return a copy of the resolved variables."""
 
-        variables = self.scheme_obj.get('variables', {})
+        resolved = {}
         for k, v in variables.items():
             m = COLOR_RE.match(v.strip())
-            var = translate_color(m, self.variables, self.scheme_obj.get('variables')) if m is not None else ""
+            var = translate_color(m, resolved, variables) if m is not None else ""
             if var is None:
                 var = ""
-            self.variables[k] = var
+            resolved[k] = var
             variables[k] = var
+        return resolved
+
+    def resolve_rule(self, item, variables):
+        """Resolve the colors of the rule in place."""
+
+        if item.get('scope', None) is not None:
+            # Foreground color
+            color = item.get('foreground', None)
+            if isinstance(color, list):
+                # Hashed Syntax Highlighting
+                for index, c in enumerate(color):
+                    color[index] = translate_color(COLOR_RE.match(c.strip()), variables, {})
+            elif isinstance(color, str):
+                item['foreground'] = translate_color(COLOR_RE.match(color.strip()), variables, {})
+            # Background color
+            bgcolor = item.get('background', None)
+            if isinstance(bgcolor, str):
+                item['background'] = translate_color(COLOR_RE.match(bgcolor.strip()), variables, {})
+            # Selection foreground color
+            scolor = item.get('selection_foreground', None)
+            if isinstance(scolor, str):
+                item['selection_foreground'] = translate_color(COLOR_RE.match(scolor.strip()), variables, {})
+        return item
+
+    def parse_scheme(self):
+        """Parse the color scheme."""
+
+        self.variables = self.resolve_variables(self.scheme_obj.get('variables', {}))
 
         global_options = self.scheme_obj[GLOBAL_OPTIONS]
         for k, v in global_options.items():
@@ -488,23 +854,7 @@ class ColorSchemeMatcher(object):
 
         # Create scope colors mapping from color scheme file
         for item in self.scheme_obj["rules"]:
-            if item.get('scope', None) is not None:
-                # Foreground color
-                color = item.get('foreground', None)
-                if isinstance(color, list):
-                    # Hashed Syntax Highlighting
-                    for index, c in enumerate(color):
-                        color[index] = translate_color(COLOR_RE.match(c.strip()), self.variables, {})
-                elif isinstance(color, str):
-                    item['foreground'] = translate_color(COLOR_RE.match(color.strip()), self.variables, {})
-                # Background color
-                bgcolor = item.get('background', None)
-                if isinstance(bgcolor, str):
-                    item['background'] = translate_color(COLOR_RE.match(bgcolor.strip()), self.variables, {})
-                # Selection foreground color
-                scolor = item.get('selection_foreground', None)
-                if isinstance(scolor, str):
-                    item['selection_foreground'] = translate_color(COLOR_RE.match(scolor.strip()), self.variables, {})
+            self.resolve_rule(item, self.variables)
 
     def setup_matcher(self):
         """Setup colors for color matcher."""
@@ -539,7 +889,14 @@ class ColorSchemeMatcher(object):
         self.special_colors["selection"] = {'color': sbground, 'color_simulated': sbground_sim}
         self.special_colors["gutter"] = {'color': gbground, 'color_simulated': gbground_sim}
         self.special_colors["gutter_foreground"] = {'color': gfground, 'color_simulated': gfground_sim}
-        self.colors = {}
+        self.build_rules()
+        self.setup_index()
+
+    def build_rules(self):
+        """Create the rule records from the scheme's rules."""
+
+        self.rules = []
+        self.rule_ids = {}
         # Create scope colors mapping from color scheme file
         for item in self.scheme_obj["rules"]:
             name = item.get('name', '')
@@ -563,38 +920,81 @@ class ColorSchemeMatcher(object):
 
                 self.add_entry(name, scope, color, bgcolor, scolor, style)
 
+    def setup_index(self):
+        """Index the rule selectors by their scope atoms and setup the scope prefix trie."""
+
+        self.rule_selectors = []
+        self.selector_index = SelectorIndex()
+        for rule in self.rules:
+            rule.selector = SchemeSelectors(rule.name, rule.scope)
+            if self.native_scoring:
+                self.rule_selectors.append(ScopeSelector(rule.scope))
+            self.selector_index.add(rule.rule_id, rule.scope)
+
+        self.scope_trie = ScopeTrie(self.selector_index, self.score_rule)
+
+    def score_scope(self, scope, elements, selector):
+        """Score the selector against the scope."""
+
+        if self.native_scoring:
+            return score_selector(elements, selector)
+        return sublime.score_selector(scope, selector)
+
+    def score_rule(self, rule_id, scope, elements):
+        """
+        Score a rule against the scope.
+
+        Scoring is done with `sublime.score_selector` unless native scoring is enabled,
+        in which case the rule's precompiled selector is used.
+        """
+
+        if self.native_scoring:
+            return self.rule_selectors[rule_id].score(elements)
+        return sublime.score_selector(scope, self.rules[rule_id].scope)
+
     def add_entry(self, name, scope, color, bgcolor, scolor, style):
-        """Add color entry."""
+        """
+        Add color entry.
+
+        Colors are only validated here.  Simulated transparency is not
+        calculated until the rule wins a lookup (see `process_rule`).
+        A rule with the same scope as an earlier rule replaces it, but
+        keeps the earlier rule's id.
+        """
 
         color_gradient = None
         if isinstance(color, list):
-            fg, fg_sim, color_gradient = self.process_color_gradient(color)
-        elif color is not None:
-            fg, fg_sim = self.process_color(color)
-        else:
-            fg, fg_sim = None, None
-        if bgcolor is not None:
-            bg, bg_sim = self.process_color(bgcolor)
+            color_gradient = [c for c in color if is_color(c)] or None
+            fg = color_gradient[0] if color_gradient is not None else None
         else:
-            bg, bg_sim = None, None
-        if scolor is not None:
-            sfg, sfg_sim = self.process_color(
-                scolor, bground=self.special_colors["selection"]['color_simulated']
-            )
-        else:
-            sfg, sfg_sim = None, None
-        self.colors[scope] = {
-            "name": name,
-            "scope": scope,
-            "color": fg,
-            "color_simulated": fg_sim,
-            "color_gradient": color_gradient,
-            "bgcolor": bg,
-            "bgcolor_simulated": bg_sim,
-            "selection_color": sfg,
-            "selection_color_simulated": sfg_sim,
-            "style": style
-        }
+            fg = color if is_color(color) else None
+        rule_id = self.rule_ids.get(scope)
+        if rule_id is None:
+            rule_id = self.rule_ids[scope] = len(self.rules)
+            self.rules.append(None)
+        self.rules[rule_id] = SchemeRule(
+            rule_id, name, scope, fg, color_gradient,
+            bgcolor if is_color(bgcolor) else None,
+            scolor if is_color(scolor) else None,
+            style
+        )
+
+    def process_rule(self, rule):
+        """Calculate the simulated transparency of the rule's colors if not already done."""
+
+        if not rule.processed:
+            if rule.color_gradient is not None:
+                rule.color_simulated, rule.color_gradient = self.process_color_gradient(rule.color_gradient)[1:]
+            elif rule.color is not None:
+                rule.color_simulated = self.process_color(rule.color)[1]
+            if rule.bgcolor is not None:
+                rule.bgcolor_simulated = self.process_color(rule.bgcolor)[1]
+            if rule.selection_color is not None:
+                rule.selection_color_simulated = self.process_color(
+                    rule.selection_color, bground=self.special_colors["selection"]['color_simulated']
+                )[1]
+            rule.processed = True
+        return rule
 
     def process_color_gradient(self, colors, simple_strip=False, bground=None):
         """
@@ -670,6 +1070,95 @@ class ColorSchemeMatcher(object):
 
         return self.scheme_file
 
+    def save_results(self):
+        """Write pending results to the persistent result store."""
+
+        if self.results is not None:
+            self.results.flush()
+
+    def cache_stats(self):
+        """Get the hit, miss, and eviction stats of the matched scope cache."""
+
+        stats = self.matched.stats()
+        stats['trie_nodes'] = self.scope_trie.nodes
+        return stats
+
+    def match_scope(self, scope_key):
+        """
+        Get the rules that win each part of the scope's appearance.
+
+        Results are looked up in the matched scope cache, then in the persistent
+        result store (if enabled), and are only resolved if not found in either.
+        """
+
+        matched = self.matched.get(scope_key)
+        if matched is None:
+            stored = self.results.get(scope_key) if self.results is not None else None
+            if stored is not None:
+                matched = ScopeMatch.load(stored[:-1] + [self.styles.intern(stored[-1])])
+            else:
+                matched = self.resolve_scope(scope_key)
+                if self.results is not None:
+                    self.results.add(scope_key, matched.dump()[:-1] + [self.styles.name(matched.style)])
+            self.matched.set(scope_key, matched)
+        return matched
+
+    def resolve_scope(self, scope_key):
+        """
+        Resolve the rules that win each part of the scope's appearance.
+
+        Parts that no rule applies to are left as `NO_RULE`.
+        """
+
+        rules = self.rules
+        fg = NO_RULE
+        fg_gradient = NO_RULE
+        bg = NO_RULE
+        selection_fg = NO_RULE
+        bold = NO_RULE
+        italic = NO_RULE
+        style = set([])
+
+        best_match_bg = 0
+        best_match_fg = 0
+        best_match_style = 0
+        best_match_sfg = 0
+        best_match_fg_gradient = 0
+        for rule_id, match in self.scope_trie.lookup(scope_key):
+            rule = rules[rule_id]
+            if (
+                not rule.color_gradient and
+                rule.color is not None and
+                match > best_match_fg
+            ):
+                best_match_fg = match
+                fg = rule_id
+            if (
+                rule.color is not None and
+                match > best_match_fg_gradient
+            ):
+                best_match_fg_gradient = match
+                fg_gradient = rule_id
+            if rule.selection_color is not None and match > best_match_sfg:
+                best_match_sfg = match
+                selection_fg = rule_id
+            if rule.style is not None and match > best_match_style:
+                best_match_style = match
+                for s in rule.style:
+                    style.add(s)
+                    if s == "bold":
+                        bold = rule_id
+                    elif s == "italic":
+                        italic = rule_id
+            if rule.bgcolor is not None and match > best_match_bg:
+                best_match_bg = match
+                bg = rule_id
+
+        if fg_gradient != NO_RULE and rules[fg_gradient].color_gradient is None:
+            fg_gradient = NO_RULE
+
+        return ScopeMatch(fg, fg_gradient, bg, selection_fg, bold, italic, self.styles.intern(' '.join(style)))
+
     def guess_color(self, scope_key, selected=False, explicit_background=False):
         """
         Guess the colors and style of the text for the given Sublime scope.
@@ -686,107 +1175,56 @@ class ColorSchemeMatcher(object):
         background would show through.
         """
 
-        color = self.special_colors['foreground']['color']
-        color_sim = self.special_colors['foreground']['color_simulated']
-        color_gradient = None
-        color_gradient_selector = None
-        bgcolor = self.special_colors['background']['color'] if not explicit_background else None
-        bgcolor_sim = self.special_colors['background']['color_simulated'] if not explicit_background else None
-        scolor = self.special_colors['selection_foreground']['color']
-        scolor_sim = self.special_colors['selection_foreground']['color_simulated']
-        style = set([])
-        color_selector = SchemeSelectors("foreground", "foreground")
-        bg_selector = SchemeSelectors("background", "background")
-        scolor_selector = SchemeSelectors("selection_foreground", "selection_foreground")
-        style_selectors = {"bold": SchemeSelectors("", ""), "italic": SchemeSelectors("", "")}
-        if scope_key in self.matched:
-            color = self.matched[scope_key]["color"]
-            color_sim = self.matched[scope_key]["color_simulated"]
-            color_gradient = self.matched[scope_key]["color_gradient"]
-            style = self.matched[scope_key]["style"]
-            bgcolor = self.matched[scope_key]["bgcolor"]
-            bgcolor_sim = self.matched[scope_key]["bgcolor_simulated"]
-            scolor = self.matched[scope_key]["scolor"]
-            scolor_sim = self.matched[scope_key]["scolor_simulated"]
-            selectors = self.matched[scope_key]["selectors"]
-            color_selector = selectors["color"]
-            bg_selector = selectors["background"]
-            scolor_selector = selectors["scolor"]
-            style_selectors = selectors["style"]
-            color_gradient_selector = selectors['color_gradient']
-        else:
-            best_match_bg = 0
-            best_match_fg = 0
-            best_match_style = 0
-            best_match_sfg = 0
-            best_match_fg_gradient = 0
-            for key in self.colors:
-                match = sublime.score_selector(scope_key, key)
-                if (
-                    not self.colors[key]['color_gradient'] and
-                    self.colors[key]["color"] is not None and
-                    match > best_match_fg
-                ):
-                    best_match_fg = match
-                    color = self.colors[key]["color"]
-                    color_sim = self.colors[key]["color_simulated"]
-                    color_selector = SchemeSelectors(self.colors[key]["name"], self.colors[key]["scope"])
-                if (
-                    self.colors[key]["color"] is not None and
-                    match > best_match_fg_gradient
-                ):
-                    best_match_fg_gradient = match
-                    color_gradient = self.colors[key]["color_gradient"]
-                    color_gradient_selector = SchemeSelectors(self.colors[key]["name"], self.colors[key]["scope"])
-                if self.colors[key]["selection_color"] is not None and match > best_match_sfg:
-                    best_match_sfg = match
-                    scolor = self.colors[key]["selection_color"]
-                    scolor_sim = self.colors[key]["selection_color_simulated"]
-                    scolor_selector = SchemeSelectors(self.colors[key]["name"], self.colors[key]["scope"])
-                if self.colors[key]["style"] is not None and match > best_match_style:
-                    best_match_style = match
-                    for s in self.colors[key]["style"]:
-                        style.add(s)
-                        if s == "bold":
-                            style_selectors["bold"] = SchemeSelectors(
-                                self.colors[key]["name"], self.colors[key]["scope"]
-                            )
-                        elif s == "italic":
-                            style_selectors["italic"] = SchemeSelectors(
-                                self.colors[key]["name"], self.colors[key]["scope"]
-                            )
-                if self.colors[key]["bgcolor"] is not None and match > best_match_bg:
-                    best_match_bg = match
-                    bgcolor = self.colors[key]["bgcolor"]
-                    bgcolor_sim = self.colors[key]["bgcolor_simulated"]
-                    bg_selector = SchemeSelectors(self.colors[key]["name"], self.colors[key]["scope"])
-
-            if len(style) == 0:
-                style = ""
-            else:
-                style = ' '.join(style)
-
-            if not isinstance(color_gradient, list):
-                color_gradient = None
-                color_gradient_selector = None
+        matched = self.match_scope(scope_key)
+        rules = self.rules
 
-            self.matched[scope_key] = {
-                "color": color,
-                "bgcolor": bgcolor,
-                "scolor": scolor,
-                "color_simulated": color_sim,
-                "bgcolor_simulated": bgcolor_sim,
-                "scolor_simulated": scolor_sim,
-                "color_gradient": color_gradient,
-                "style": style,
-                "selectors": {
-                    "color": color_selector,
-                    "background": bg_selector,
-                    "scolor": scolor_selector,
-                    "style": style_selectors,
-                    "color_gradient": color_gradient_selector
-                }
-            }
+        if matched.fg != NO_RULE:
+            rule = self.process_rule(rules[matched.fg])
+            color = rule.color
+            color_sim = rule.color_simulated
+            color_selector = rule.selector
+        else:
+            color = self.special_colors['foreground']['color']
+            color_sim = self.special_colors['foreground']['color_simulated']
+            color_selector = FG_SELECTOR
+
+        if matched.fg_gradient != NO_RULE:
+            rule = self.process_rule(rules[matched.fg_gradient])
+            color_gradient = rule.color_gradient
+            color_gradient_selector = rule.selector
+        else:
+            color_gradient = None
+            color_gradient_selector = None
+
+        if matched.bg != NO_RULE:
+            rule = self.process_rule(rules[matched.bg])
+            bgcolor = rule.bgcolor
+            bgcolor_sim = rule.bgcolor_simulated
+            bg_selector = rule.selector
+        elif not explicit_background:
+            bgcolor = self.special_colors['background']['color']
+            bgcolor_sim = self.special_colors['background']['color_simulated']
+            bg_selector = BG_SELECTOR
+        else:
+            bgcolor = None
+            bgcolor_sim = None
+            bg_selector = BG_SELECTOR
+
+        if matched.selection_fg != NO_RULE:
+            rule = self.process_rule(rules[matched.selection_fg])
+            scolor = rule.selection_color
+            scolor_sim = rule.selection_color_simulated
+            scolor_selector = rule.selector
+        else:
+            scolor = self.special_colors['selection_foreground']['color']
+            scolor_sim = self.special_colors['selection_foreground']['color_simulated']
+            scolor_selector = SFG_SELECTOR
+
+        style = self.styles.name(matched.style)
+        style_selectors = {
+            "bold": rules[matched.bold].selector if matched.bold != NO_RULE else NO_SELECTOR,
+            "italic": rules[matched.italic].selector if matched.italic != NO_RULE else NO_SELECTOR
+        }
 
         if selected:
             if scolor:
@@ -798,9 +1236,28 @@ class ColorSchemeMatcher(object):
             if self.special_colors['selection']['color']:
                 bgcolor = self.special_colors['selection']['color']
                 bgcolor_sim = self.special_colors['selection']['color_simulated']
-                bg_selector = SchemeSelectors("selection", "selection")
+                bg_selector = SELECTION_SELECTOR
 
         return SchemeColors(
             color, color_sim, bgcolor, bgcolor_sim, style, color_gradient,
             color_selector, bg_selector, style_selectors, color_gradient_selector
         )
+
+    def guess_colors(self, scopes, selected=False, explicit_background=False):
+        """
+        Guess the colors and style of the text for each of the given Sublime scopes.
+
+        Results are returned in the same order as the scopes.  Each distinct scope
+        is only resolved once and duplicates share the same result.  Scopes that share
+        prefixes also share the rule scores of those prefixes.
+        """
+
+        resolved = {}
+        results = []
+        for scope_key in scopes:
+            key = ' '.join(scope_key.split())
+            colors = resolved.get(key)
+            if colors is None:
+                colors = resolved[key] = self.guess_color(scope_key, selected, explicit_background)
+            results.append(colors)
+        return results
@@ -0,0 +1,130 @@
+"""
+LRU cache.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """
+    Bounded least recently used cache.
+
+    When the cache is full, the least recently used entry is evicted,
+    and `on_evict`, if given, is called with the evicted key and value.
+    Hits, misses, and evictions are counted and available via `stats`.
+    """
+
+    def __init__(self, maxsize=1000, on_evict=None):
+        """Initialize."""
+
+        self.maxsize = max(1, int(maxsize))
+        self.on_evict = on_evict
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        """Get number of cached entries."""
+
+        return len(self.cache)
+
+    def __contains__(self, key):
+        """Check if key is cached without affecting its recent usage or the stats."""
+
+        return key in self.cache
+
+    def get(self, key, default=None):
+        """Get cached entry and mark it as most recently used."""
+
+        with self.lock:
+            try:
+                value = self.cache[key]
+            except KeyError:
+                self.misses += 1
+                return default
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def peek(self, key, default=None):
+        """Get cached entry without affecting its recent usage or the stats."""
+
+        with self.lock:
+            return self.cache.get(key, default)
+
+    def set(self, key, value):
+        """Cache the entry, evicting the least recently used entries if over capacity."""
+
+        with self.lock:
+            self.cache[key] = value
+            self.cache.move_to_end(key)
+            evicted = self._trim()
+        self._evicted(evicted)
+
+    def pop(self, key, default=None):
+        """Remove the entry."""
+
+        with self.lock:
+            return self.cache.pop(key, default)
+
+    def keys(self):
+        """Get the cached keys from least to most recently used."""
+
+        with self.lock:
+            return list(self.cache.keys())
+
+    def items(self):
+        """Get the cached entries from least to most recently used."""
+
+        with self.lock:
+            return list(self.cache.items())
+
+    def resize(self, maxsize):
+        """Change the capacity, evicting entries if needed."""
+
+        with self.lock:
+            self.maxsize = max(1, int(maxsize))
+            evicted = self._trim()
+        self._evicted(evicted)
+
+    def clear(self):
+        """Clear the cache and the stats."""
+
+        with self.lock:
+            self.cache.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        """Get cache stats."""
+
+        with self.lock:
+            return {
+                "size": len(self.cache),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+    def _trim(self):
+        """Evict least recently used entries until within capacity, and return the evicted entries."""
+
+        evicted = []
+        while len(self.cache) > self.maxsize:
+            evicted.append(self.cache.popitem(last=False))
+            self.evictions += 1
+        return evicted
+
+    def _evicted(self, evicted):
+        """Notify `on_evict` of the evicted entries outside of the lock."""
+
+        if self.on_evict is not None:
+            for key, value in evicted:
+                self.on_evict(key, value)
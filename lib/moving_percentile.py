@@ -0,0 +1,36 @@
+"""
+Moving percentile.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+from collections import deque
+import math
+
+
+class MovingPercentile(object):
+    """Percentiles of the most recent samples."""
+
+    def __init__(self, size=20):
+        """Initialize."""
+
+        self.samples = deque(maxlen=max(1, int(size)))
+
+    def __len__(self):
+        """Get number of samples."""
+
+        return len(self.samples)
+
+    def add(self, value):
+        """Add a sample, dropping the oldest sample if full."""
+
+        self.samples.append(value)
+
+    def percentile(self, percent, default=None):
+        """Get the nearest rank percentile of the samples, or `default` if there are none."""
+
+        if not self.samples:
+            return default
+        ordered = sorted(self.samples)
+        rank = int(math.ceil(percent / 100.0 * len(ordered)))
+        return ordered[min(max(rank, 1), len(ordered)) - 1]
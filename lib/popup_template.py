@@ -0,0 +1,48 @@
+"""
+Popup template.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import threading
+import jinja2
+
+
+class PopupTemplate(object):
+    """
+    Jinja template, loaded and compiled once.
+
+    `load` is called to get the template's source the first time the
+    template is rendered.  The compiled template is kept until `clear`
+    is called, when the source changes.
+    """
+
+    def __init__(self, load, **options):
+        """Initialize."""
+
+        self.load = load
+        self.options = options
+        self.template = None
+        self.lock = threading.Lock()
+
+    def clear(self):
+        """Forget the compiled template, so it is loaded again on the next render."""
+
+        with self.lock:
+            self.template = None
+
+    def compile(self):
+        """Get the compiled template, compiling it if needed."""
+
+        with self.lock:
+            if self.template is None:
+                self.template = jinja2.Environment(**self.options).from_string(self.load())
+            return self.template
+
+    def render(self, **variables):
+        """Render the template."""
+
+        template = self.template
+        if template is None:
+            template = self.compile()
+        return template.render(**variables)
@@ -0,0 +1,128 @@
+"""
+Persistent result cache.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import codecs
+import json
+import os
+import threading
+import time
+
+
+class ResultStore(object):
+    """
+    Append only, on disk store of results by scope.
+
+    The first line of the file records the key the results were computed for
+    (the scheme's content hash), and when the store that started the file was
+    created.  If the key does not match, the results are discarded and the file
+    is started over.  Each following line is a JSON encoded `[scope, result]`
+    pair.  The file is read the first time a result is requested, and new
+    results are buffered and appended in batches.
+
+    Stores for an old and a new key can be alive at once, while a scheme is
+    reloaded.  Before appending, the header is read again, and a store only
+    starts the file over if it was started by an older store, so a late flush
+    from an old store never mixes its results into a newer store's file.
+    """
+
+    def __init__(self, filename, key, flush_size=32, max_entries=20000):
+        """Initialize."""
+
+        self.filename = filename
+        self.key = key
+        self.flush_size = flush_size
+        self.max_entries = max_entries
+        self.created = time.time()
+        self.lock = threading.Lock()
+        self.entries = None
+        self.pending = []
+
+    def load(self):
+        """Load the stored results."""
+
+        self.entries = {}
+        try:
+            with codecs.open(self.filename, 'r', encoding='utf-8') as f:
+                header = json.loads(f.readline())
+                if header.get('key') != self.key:
+                    return
+                for line in f:
+                    try:
+                        scope, result = json.loads(line)
+                    except Exception:
+                        # Partially written line
+                        continue
+                    self.entries[scope] = result
+        except Exception:
+            pass
+
+    def read_header(self):
+        """Get the file's header, or `None` if it has no valid header, and whether the file ends with a newline."""
+
+        try:
+            with open(self.filename, 'rb') as f:
+                header = json.loads(f.readline().decode('utf-8'))
+                f.seek(-1, os.SEEK_END)
+                return (header if isinstance(header, dict) else None), f.read(1) == b'\n'
+        except Exception:
+            return None, True
+
+    def get(self, scope):
+        """Get a stored result."""
+
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            return self.entries.get(scope)
+
+    def add(self, scope, result):
+        """Store a result."""
+
+        with self.lock:
+            if self.entries is None:
+                self.load()
+            if scope in self.entries or len(self.entries) >= self.max_entries:
+                return
+            self.entries[scope] = result
+            self.pending.append((scope, result))
+            if len(self.pending) >= self.flush_size:
+                self._flush()
+
+    def flush(self):
+        """Write pending results to disk."""
+
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        """Write pending results to disk."""
+
+        if not self.pending:
+            return
+        try:
+            folder = os.path.dirname(self.filename)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            header, newline = self.read_header()
+            if header is not None and header.get('key') == self.key:
+                f = codecs.open(self.filename, 'a', encoding='utf-8')
+                if not newline:
+                    # Start after a partially written line.
+                    f.write('\n')
+            elif header is None or header.get('created', 0) <= self.created:
+                # Results were computed for a different key: start over.
+                f = codecs.open(self.filename, 'w', encoding='utf-8')
+                f.write(json.dumps({'key': self.key, 'created': self.created}) + '\n')
+            else:
+                # A newer store started the file over: its results replace these.
+                f = None
+            if f is not None:
+                with f:
+                    for entry in self.pending:
+                        f.write(json.dumps(entry) + '\n')
+        except Exception:
+            pass
+        self.pending = []
@@ -0,0 +1,132 @@
+"""
+Color scheme records.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+
+NO_RULE = -1
+
+
+class SchemeRule(object):
+    """
+    A color scheme rule.
+
+    Rules are identified by their integer id, which is their position in the
+    matcher's rule list.  Simulated colors are `None` until the rule is processed.
+    """
+
+    __slots__ = (
+        'rule_id', 'name', 'scope', 'color', 'color_simulated', 'color_gradient',
+        'bgcolor', 'bgcolor_simulated', 'selection_color', 'selection_color_simulated',
+        'style', 'processed', 'selector'
+    )
+
+    # Fields saved by `dump`, `selector` is recreated by the matcher.
+    FIELDS = __slots__[:-1]
+
+    def __init__(self, rule_id, name, scope, color, color_gradient, bgcolor, selection_color, style):
+        """Initialize."""
+
+        self.rule_id = rule_id
+        self.name = name
+        self.scope = scope
+        self.color = color
+        self.color_simulated = None
+        self.color_gradient = color_gradient
+        self.bgcolor = bgcolor
+        self.bgcolor_simulated = None
+        self.selection_color = selection_color
+        self.selection_color_simulated = None
+        self.style = style
+        self.processed = False
+        self.selector = None
+
+    def dump(self):
+        """Dump the rule to a list of JSON serializable values."""
+
+        return [getattr(self, field) for field in self.FIELDS]
+
+    @classmethod
+    def load(cls, data):
+        """Load a rule from a list of dumped values."""
+
+        rule = cls.__new__(cls)
+        for field, value in zip(cls.FIELDS, data):
+            setattr(rule, field, value)
+        if rule.processed and rule.color_gradient is not None:
+            rule.color_gradient = [tuple(c) for c in rule.color_gradient]
+        rule.selector = None
+        return rule
+
+    def copy(self):
+        """Copy the rule, without its selector."""
+
+        return self.load(self.dump())
+
+
+class ScopeMatch(object):
+    """
+    The rules that won each part of a scope's appearance.
+
+    Each winner is stored as a rule id, or `NO_RULE` if no rule applied.
+    The combined font style is stored as a style id.
+    """
+
+    __slots__ = ('fg', 'fg_gradient', 'bg', 'selection_fg', 'bold', 'italic', 'style')
+
+    def __init__(self, fg, fg_gradient, bg, selection_fg, bold, italic, style):
+        """Initialize."""
+
+        self.fg = fg
+        self.fg_gradient = fg_gradient
+        self.bg = bg
+        self.selection_fg = selection_fg
+        self.bold = bold
+        self.italic = italic
+        self.style = style
+
+    def dump(self):
+        """Dump the match to a list."""
+
+        return [self.fg, self.fg_gradient, self.bg, self.selection_fg, self.bold, self.italic, self.style]
+
+    @classmethod
+    def load(cls, data):
+        """Load a match from a list of dumped values."""
+
+        return cls(*data)
+
+    def remap(self, ids):
+        """Replace the rule ids with new ids from a mapping of old to new ids."""
+
+        self.fg = ids.get(self.fg, self.fg)
+        self.fg_gradient = ids.get(self.fg_gradient, self.fg_gradient)
+        self.bg = ids.get(self.bg, self.bg)
+        self.selection_fg = ids.get(self.selection_fg, self.selection_fg)
+        self.bold = ids.get(self.bold, self.bold)
+        self.italic = ids.get(self.italic, self.italic)
+
+
+class StyleTable(object):
+    """Intern font style strings as integer ids."""
+
+    def __init__(self):
+        """Initialize."""
+
+        self.names = ['']
+        self.ids = {'': 0}
+
+    def intern(self, style):
+        """Get the id of the style."""
+
+        style_id = self.ids.get(style)
+        if style_id is None:
+            style_id = self.ids[style] = len(self.names)
+            self.names.append(style)
+        return style_id
+
+    def name(self, style_id):
+        """Get the style for the id."""
+
+        return self.names[style_id]
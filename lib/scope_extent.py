@@ -0,0 +1,53 @@
+"""
+Scope extent.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+
+
+def char_token(pt):
+    """Get the character at the point as a token."""
+
+    return pt, pt + 1
+
+
+def find_extent(view, pt, selector, window, token=char_token):
+    """
+    Find the extent of the characters around the point that match the selector.
+
+    Instead of searching the whole file with `find_by_selector`, the extent is
+    expanded from the point, one token at a time, for up to `window` characters
+    on each side.  `token` gets the start and end of the token containing the
+    character at a point, all of whose characters have the same scope.  Unless
+    the view's tokens are known, each character is its own token.  The characters
+    on either side of the point are considered, so a point at the end of an
+    extent is still in it.
+
+    Returns the `(begin, end)` of the extent, `(pt, pt)` if no character
+    next to the point matches, or `None` if the extent reaches the window
+    and the whole file must be searched instead.
+    """
+
+    size = view.size()
+    lower = max(0, pt - window)
+    upper = min(size, pt + window)
+
+    if pt < size and view.match_selector(pt, selector):
+        begin, end = token(pt)
+    elif pt > 0 and view.match_selector(pt - 1, selector):
+        begin, end = token(pt - 1)
+    else:
+        return pt, pt
+
+    while begin > 0 and view.match_selector(begin - 1, selector):
+        if begin <= lower:
+            return None
+        begin = token(begin - 1)[0]
+    while end < size and view.match_selector(end, selector):
+        if end >= upper:
+            return None
+        end = token(end)[1]
+    if begin < lower or end > upper:
+        return None
+    return begin, end
@@ -0,0 +1,366 @@
+"""
+Scope selector helpers.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import re
+
+RE_TOKEN = re.compile(r'\s*(?:(?P<op>[(),|&])|(?P<exclude>-)|(?P<atom>[^\s(),|&]+))')
+
+
+def tokenize(selector):
+    """Split a selector into operators, exclusions, and atoms."""
+
+    tokens = []
+    for m in RE_TOKEN.finditer(selector):
+        if m.group('op'):
+            tokens.append(m.group('op'))
+        elif m.group('exclude'):
+            tokens.append('-')
+        elif m.group('atom'):
+            tokens.append(m.group('atom'))
+    return tokens
+
+
+def atom_prefixes(element):
+    """Get all of the dotted prefixes of a scope element: `a.b.c` -> `a`, `a.b`, `a.b.c`."""
+
+    prefixes = []
+    end = element.find('.')
+    while end != -1:
+        prefixes.append(element[:end])
+        end = element.find('.', end + 1)
+    prefixes.append(element)
+    return prefixes
+
+
+def selector_atoms(selector):
+    """
+    Get the atoms of a selector.
+
+    Returns a tuple of all atoms found in the selector and a flag indicating
+    whether some alternative of the selector has no positive atoms.  Such
+    alternatives cannot be ruled out by looking at the scope's atoms alone.
+    """
+
+    atoms = set()
+    # Each group tracks: all branches positive so far, current branch positive, group is excluded.
+    stack = [[True, False, False]]
+    exclude = False
+    for token in tokenize(selector):
+        group = stack[-1]
+        if token == '(':
+            stack.append([True, False, exclude])
+            exclude = False
+        elif token == ')':
+            if len(stack) > 1:
+                stack.pop()
+                if group[0] and group[1] and not group[2]:
+                    stack[-1][1] = True
+            exclude = False
+        elif token in (',', '|'):
+            group[0] = group[0] and group[1]
+            group[1] = False
+            exclude = False
+        elif token in ('-', '&'):
+            exclude = token == '-'
+        else:
+            atoms.add(token)
+            if not exclude:
+                group[1] = True
+    while len(stack) > 1:
+        group = stack.pop()
+        if group[0] and group[1] and not group[2]:
+            stack[-1][1] = True
+    return atoms, not (stack[0][0] and stack[0][1])
+
+
+class PathSelector(object):
+    """
+    Match a path of atoms against the scope's elements.
+
+    Atoms are matched right to left against the deepest element they can match.
+    Each matched atom scores its number of dotted segments weighted by `8 ** depth`
+    of the element it matched, so deeper and more specific matches score higher.
+    """
+
+    __slots__ = ('atoms',)
+
+    def __init__(self, atoms):
+        """Initialize."""
+
+        self.atoms = tuple(reversed([(atom, atom + '.', atom.count('.') + 1) for atom in atoms]))
+
+    def score(self, elements):
+        """Score the scope elements."""
+
+        index = len(elements)
+        total = 0
+        for atom, dotted, weight in self.atoms:
+            index -= 1
+            while index >= 0:
+                element = elements[index]
+                if element == atom or element.startswith(dotted):
+                    break
+                index -= 1
+            else:
+                return 0
+            total += weight << (3 * index)
+        return total
+
+
+class NegateSelector(object):
+    """Match when the selector does not match."""
+
+    __slots__ = ('selector',)
+
+    def __init__(self, selector):
+        """Initialize."""
+
+        self.selector = selector
+
+    def score(self, elements):
+        """Score the scope elements."""
+
+        return 0 if self.selector.score(elements) else 1
+
+
+class ExcludeSelector(object):
+    """Match the left selector when the right selector does not match."""
+
+    __slots__ = ('left', 'right')
+
+    def __init__(self, left, right):
+        """Initialize."""
+
+        self.left = left
+        self.right = right
+
+    def score(self, elements):
+        """Score the scope elements."""
+
+        score = self.left.score(elements)
+        if score and self.right.score(elements):
+            return 0
+        return score
+
+
+class AndSelector(object):
+    """Match when both selectors match."""
+
+    __slots__ = ('left', 'right')
+
+    def __init__(self, left, right):
+        """Initialize."""
+
+        self.left = left
+        self.right = right
+
+    def score(self, elements):
+        """Score the scope elements."""
+
+        left = self.left.score(elements)
+        if not left:
+            return 0
+        right = self.right.score(elements)
+        if not right:
+            return 0
+        return max(left, right)
+
+
+class OrSelector(object):
+    """Match the best scoring selector."""
+
+    __slots__ = ('selectors',)
+
+    def __init__(self, selectors):
+        """Initialize."""
+
+        self.selectors = tuple(selectors)
+
+    def score(self, elements):
+        """Score the scope elements."""
+
+        best = 0
+        for selector in self.selectors:
+            score = selector.score(elements)
+            if score > best:
+                best = score
+        return best
+
+
+class SelectorParser(object):
+    """
+    Compile a selector string into a tree of selector objects.
+
+    ```
+    selector   := composite (('|' | ',') composite)*
+    composite  := expression (('&' | '-') expression)*
+    expression := '-'? (group | path)
+    group      := '(' selector ')'
+    path       := atom+
+    ```
+
+    `-` and `&` bind tighter than `|` and `,` and are evaluated left to right.
+    Unbalanced parentheses are tolerated.
+    """
+
+    def __init__(self, selector):
+        """Initialize."""
+
+        self.tokens = tokenize(selector)
+        self.index = 0
+
+    def peek(self):
+        """Peek at the next token."""
+
+        return self.tokens[self.index] if self.index < len(self.tokens) else None
+
+    def parse(self):
+        """Parse the selector."""
+
+        selector = self.parse_selector()
+        while self.peek() is not None:
+            # Stray closing parenthesis: skip and keep going.
+            self.index += 1
+            selector = OrSelector([selector, self.parse_selector()])
+        return selector
+
+    def parse_selector(self):
+        """Parse comma and `|` separated composites."""
+
+        selectors = []
+        composite = self.parse_composite()
+        if composite is not None:
+            selectors.append(composite)
+        while self.peek() in (',', '|'):
+            self.index += 1
+            composite = self.parse_composite()
+            if composite is not None:
+                selectors.append(composite)
+        return selectors[0] if len(selectors) == 1 else OrSelector(selectors)
+
+    def parse_composite(self):
+        """Parse `&` and `-` joined expressions."""
+
+        left = self.parse_expression()
+        while self.peek() in ('&', '-'):
+            op = self.tokens[self.index]
+            self.index += 1
+            right = self.parse_expression()
+            if right is None:
+                continue
+            if left is None:
+                left = NegateSelector(right) if op == '-' else right
+            elif op == '-':
+                left = ExcludeSelector(left, right)
+            else:
+                left = AndSelector(left, right)
+        return left
+
+    def parse_expression(self):
+        """Parse a possibly negated group or path."""
+
+        token = self.peek()
+        if token == '-':
+            self.index += 1
+            expression = self.parse_expression()
+            return NegateSelector(expression) if expression is not None else None
+        if token == '(':
+            self.index += 1
+            expression = self.parse_selector()
+            if self.peek() == ')':
+                self.index += 1
+            return expression
+        atoms = []
+        while token is not None and token not in ('(', ')', ',', '|', '&', '-'):
+            atoms.append(token)
+            self.index += 1
+            token = self.peek()
+        return PathSelector(atoms) if atoms else None
+
+
+class ScopeSelector(object):
+    """A selector compiled once and reusable for scoring any number of scopes."""
+
+    __slots__ = ('selector', 'matcher')
+
+    def __init__(self, selector):
+        """Initialize."""
+
+        self.selector = selector
+        self.matcher = SelectorParser(selector).parse()
+
+    def score(self, scope):
+        """
+        Score the scope against the selector.
+
+        Scope can be given as a scope string or as a list of its elements.
+        """
+
+        if isinstance(scope, str):
+            scope = scope.split()
+        return self.matcher.score(scope)
+
+
+_compiled = {}
+
+
+def score_selector(scope, selector):
+    """Score the scope against the selector like `sublime.score_selector`."""
+
+    compiled = _compiled.get(selector)
+    if compiled is None:
+        if len(_compiled) >= 1000:
+            _compiled.clear()
+        compiled = _compiled[selector] = ScopeSelector(selector)
+    return compiled.score(scope)
+
+
+class SelectorIndex(object):
+    """
+    Inverted index of scope atoms to the rules whose selectors reference them.
+
+    A rule can only score against a scope if one of its atoms is a dotted prefix
+    of one of the scope's elements, so only those rules need to be scored.
+    """
+
+    def __init__(self):
+        """Initialize."""
+
+        self.atoms = {}
+        self.unbound = set()
+        self.elements = {}
+
+    def add(self, rule_id, selector):
+        """Index the rule's selector."""
+
+        atoms, unbound = selector_atoms(selector)
+        for atom in atoms:
+            self.atoms.setdefault(atom, set()).add(rule_id)
+        if unbound:
+            self.unbound.add(rule_id)
+        self.elements.clear()
+
+    def element_candidates(self, element):
+        """Get the rules that reference atoms matching the given scope element."""
+
+        rules = self.elements.get(element)
+        if rules is None:
+            rules = set()
+            for prefix in atom_prefixes(element):
+                found = self.atoms.get(prefix)
+                if found:
+                    rules |= found
+            rules = frozenset(rules)
+            self.elements[element] = rules
+        return rules
+
+    def candidates(self, scope):
+        """Get the rules, in rule order, that could possibly match the scope."""
+
+        rules = set(self.unbound)
+        for element in scope.split():
+            rules |= self.element_candidates(element)
+        return sorted(rules)
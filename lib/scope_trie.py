@@ -0,0 +1,93 @@
+"""
+Scope prefix trie.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+
+
+class ScopeNode(object):
+    """Rule scores for one scope prefix."""
+
+    __slots__ = ('scope', 'elements', 'scores', 'children', 'ranked')
+
+    def __init__(self, scope, elements, scores):
+        """Initialize."""
+
+        self.scope = scope
+        self.elements = elements
+        self.scores = scores
+        self.children = {}
+        self.ranked = None
+
+    def rank(self):
+        """Get the non-zero rule scores in rule order."""
+
+        if self.ranked is None:
+            self.ranked = sorted(self.scores.items())
+        return self.ranked
+
+
+class ScopeTrie(object):
+    """
+    Cache rule scores by scope prefix.
+
+    Scopes share long prefixes (`source.python meta.function.python ...`).
+    A rule's score can only change when an element is added to the scope
+    that matches one of the rule's atoms, so each node only rescores the
+    rules the selector index associates with its last element, and inherits
+    the rest of its scores from its parent.  Rules with unbound selectors,
+    such as `- comment`, have no atoms to be found by, and how the scoring
+    backend scores them can depend on the whole scope, so they are rescored
+    at every node.
+    """
+
+    def __init__(self, index, score, max_nodes=20000):
+        """
+        Initialize.
+
+        `score` is called with the rule id, the scope string, and the scope elements.
+        """
+
+        self.index = index
+        self.score = score
+        self.max_nodes = max_nodes
+        self.clear()
+
+    def clear(self):
+        """Clear the trie."""
+
+        self.root = ScopeNode('', [], {})
+        self.nodes = 1
+
+    def extend(self, node, element):
+        """Create the child node for the element."""
+
+        scope = (node.scope + ' ' + element) if node.scope else element
+        elements = node.elements + [element]
+        scores = dict(node.scores)
+        for rule_id in self.index.element_candidates(element) | self.index.unbound:
+            match = self.score(rule_id, scope, elements)
+            if match:
+                scores[rule_id] = match
+            else:
+                scores.pop(rule_id, None)
+        child = ScopeNode(scope, elements, scores)
+        node.children[element] = child
+        self.nodes += 1
+        return child
+
+    def lookup(self, scope):
+        """Get the non-zero rule scores, in rule order, for the scope."""
+
+        elements = scope.split()
+        if self.nodes + len(elements) > self.max_nodes:
+            # Start over so memory stays bounded.
+            self.clear()
+        node = self.root
+        for element in elements:
+            child = node.children.get(element)
+            if child is None:
+                child = self.extend(node, element)
+            node = child
+        return node.rank()
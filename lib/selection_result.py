@@ -0,0 +1,150 @@
+"""
+Selection result.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+
+# Text Entry
+ENTRY = "%-30s %s"
+SCOPE_KEY = "Scope"
+COUNT_KEY = "Selections"
+PTS_KEY = "Scope Extents (Pts)"
+PTS_VALUE = "(%d, %d)"
+CHAR_LINE_KEY = "Scope Extents (Line/Char)"
+CHAR_LINE_VALUE = "(line: %d char: %d, line: %d char: %d)"
+FG_KEY = "Fg"
+FG_SIM_KEY = "Fg (Simulated Alpha)"
+BG_KEY = "Bg"
+BG_SIM_KEY = "Bg (Simulated Alpha)"
+STYLE_KEY = "Style"
+FG_NAME_KEY = "Fg Name"
+FG_SCOPE_KEY = "Fg Scope"
+BG_NAME_KEY = "Bg Name"
+BG_SCOPE_KEY = "Bg Scope"
+BOLD_NAME_KEY = "Bold Name"
+BOLD_SCOPE_KEY = "Bold Scope"
+ITALIC_NAME_KEY = "Italic Name"
+ITALIC_SCOPE_KEY = "Italic Scope"
+SCHEME_KEY = "tmTheme File"
+SYNTAX_KEY = "Syntax File"
+OVERRIDE_SCHEME_KEY = "Scheme"
+HASHED_FG_KEY = "Hashed Fg"
+HASHED_FG_SIM_KEY = "Hashed Fg (Simulated Alpha)"
+HASHED_FG_NAME_KEY = "Hashed Fg Name"
+HASHED_FG_SCOPE_KEY = "Hashed Fg Scope"
+DIVIDER = "------"
+MORE = "+%d more scopes in %d selections"
+
+
+def is_transparent(color):
+    """Check if the color is not fully opaque."""
+
+    return len(color) == 9 and not color.lower().endswith('ff')
+
+
+class SelectionResult(object):
+    """
+    What is shown for a selection, or for `count` selections with the same scope.
+
+    Parts that are not shown are `None`: the scope extent's `points`, its zero
+    based `rowcol`, the `appearance` and `selectors` from the scheme's colors,
+    and the `files` as `(syntax, scheme, overrides)`, where `scheme` is `None`
+    unless it is a tmTheme.  Nothing is formatted until an output asks for it.
+    """
+
+    __slots__ = ('scope', 'count', 'points', 'rowcol', 'appearance', 'selectors', 'files')
+
+    def __init__(self, scope, count=1, points=None, rowcol=None, appearance=None, selectors=None, files=None):
+        """Initialize."""
+
+        self.scope = scope
+        self.count = count
+        self.points = points
+        self.rowcol = rowcol
+        self.appearance = appearance
+        self.selectors = selectors
+        self.files = files
+
+    def entries(self, simulated=False):
+        """
+        Get the shown values as `(link, label, value)` entries, in display order.
+
+        `link` is the popup link that copies the value.  Simulated alpha
+        colors are only included if `simulated` is enabled.
+        """
+
+        entries = [('copy-scope', SCOPE_KEY, self.scope.strip())]
+
+        if self.points is not None:
+            entries.append(('copy-points', PTS_KEY, PTS_VALUE % self.points))
+        if self.rowcol is not None:
+            row1, col1, row2, col2 = self.rowcol
+            entries.append(
+                ('copy-line-char', CHAR_LINE_KEY, CHAR_LINE_VALUE % (row1 + 1, col1 + 1, row2 + 1, col2 + 1))
+            )
+
+        colors = self.appearance
+        if colors is not None:
+            entries.append(('copy-fg', FG_KEY, colors.fg))
+            if simulated and is_transparent(colors.fg):
+                entries.append(('copy-fg-sim', FG_SIM_KEY, colors.fg_simulated))
+            if colors.color_gradient:
+                entries.append(('copy-fg-hash', HASHED_FG_KEY, ', '.join(c for c, cs in colors.color_gradient)))
+                if simulated and any(is_transparent(cs) for c, cs in colors.color_gradient):
+                    entries.append(
+                        ('copy-fg-hash-sim', HASHED_FG_SIM_KEY, ', '.join(cs for c, cs in colors.color_gradient))
+                    )
+            entries.append(('copy-bg', BG_KEY, colors.bg))
+            if simulated and is_transparent(colors.bg):
+                entries.append(('copy-bg-sim', BG_SIM_KEY, colors.bg_simulated))
+            entries.append(('copy-style', STYLE_KEY, colors.style if colors.style else "normal"))
+
+        colors = self.selectors
+        if colors is not None:
+            entries.append(('copy-fg-sel-name', FG_NAME_KEY, colors.fg_selector.name))
+            entries.append(('copy-fg-sel-scope', FG_SCOPE_KEY, colors.fg_selector.scope))
+            if colors.color_gradient_selector:
+                entries.append(('copy-fg-hash-sel-name', HASHED_FG_NAME_KEY, colors.color_gradient_selector.name))
+                entries.append(('copy-fg-hash-sel-scope', HASHED_FG_SCOPE_KEY, colors.color_gradient_selector.scope))
+            entries.append(('copy-bg-sel-name', BG_NAME_KEY, colors.bg_selector.name))
+            entries.append(('copy-bg-sel-scope', BG_SCOPE_KEY, colors.bg_selector.scope))
+            for style, name_key, scope_key in (
+                ('bold', BOLD_NAME_KEY, BOLD_SCOPE_KEY),
+                ('italic', ITALIC_NAME_KEY, ITALIC_SCOPE_KEY)
+            ):
+                selector = colors.style_selectors[style]
+                if selector.name != "" or selector.scope != "":
+                    entries.append(('copy-%s-sel-name' % style, name_key, selector.name))
+                    entries.append(('copy-%s-sel-scope' % style, scope_key, selector.scope))
+
+        if self.files is not None:
+            syntax, scheme, overrides = self.files
+            entries.append(('copy-syntax', SYNTAX_KEY, syntax))
+            if scheme is not None:
+                entries.append(('copy-scheme', SCHEME_KEY, scheme))
+            for idx, override in enumerate(overrides, 1):
+                entries.append(('copy-overrides:%d' % idx, OVERRIDE_SCHEME_KEY + (" %d" % idx), override))
+
+        return entries
+
+    def lookup(self, link, simulated=False):
+        """Get the `(label, value)` of the entry the link copies, or `None` if it isn't shown."""
+
+        for entry_link, label, value in self.entries(simulated):
+            if entry_link == link:
+                return label, value
+        return None
+
+    def text(self, simulated=False):
+        """Get the lines of the text output, ending with a divider."""
+
+        lines = []
+        for link, label, value in self.entries(simulated):
+            if link == 'copy-scope':
+                value = value.replace(" ", "\n" + (" " * 31))
+            lines.append(ENTRY % (label + ':', value))
+            if link == 'copy-scope' and self.count > 1:
+                lines.append(ENTRY % (COUNT_KEY + ':', self.count))
+        lines.append(DIVIDER)
+        return lines
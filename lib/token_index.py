@@ -0,0 +1,180 @@
+"""
+Token index.
+
+Licensed under MIT
+Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
+"""
+import bisect
+
+
+class Line(object):
+    """
+    The tokens of a line, or of a chunk of a long line.
+
+    Tokens are stored as their start points and scope ids.  The line covers
+    its characters, including its newline, from `begin` up to `end`.
+    """
+
+    __slots__ = ('begin', 'end', 'starts', 'scopes')
+
+    def __init__(self, begin, end, starts, scopes):
+        """Initialize."""
+
+        self.begin = begin
+        self.end = end
+        self.starts = starts
+        self.scopes = scopes
+
+
+class TokenIndex(object):
+    """
+    Index of a view's tokens, built lazily one line at a time.
+
+    The first time a point in a line is looked up, the scope of each of the
+    line's characters is read from the view, and the line's tokens are stored
+    with interned scope ids.  Later lookups in the line are a binary search.
+    Lines longer than `chunk_size`, such as minified code, are indexed one
+    chunk of `chunk_size` characters at a time instead, so a lookup never
+    reads more than a chunk's scopes, however long its line is.
+    The index exposes the parts of the view API it answers, so it can be used
+    in place of the view.
+
+    The index is only valid for the view's change count and syntax it was built
+    for.  When the view is modified, `invalidate` drops the lines from the
+    modified point on (the scopes of later lines can depend on the edit), and
+    `sync` drops every line if the view was modified, or its syntax changed,
+    without the index being told.  As lines indexed before the view finished
+    lexing them can be stale, `verify` checks a point against its live scope.
+    `selection` and `command` can be used to remember where the view's
+    selection was, and which text command ran, before an edit, to know where
+    the edit started.
+    """
+
+    def __init__(self, view, max_lines=5000, max_matches=5000, chunk_size=256):
+        """Initialize."""
+
+        self.view = view
+        self.chunk_size = chunk_size
+        self.max_lines = max_lines
+        self.max_matches = max_matches
+        self.names = []
+        self.ids = {}
+        self.matched = {}
+        self.selection = None
+        self.command = None
+        self.clear()
+
+    def clear(self):
+        """Drop every line."""
+
+        self.begins = []
+        self.lines = []
+        self.change_count = self.view.change_count()
+        self.length = self.view.size()
+        self.syntax = self.view.settings().get('syntax')
+
+    def sync(self):
+        """Drop every line if the view was modified, or its syntax changed, since the index was last updated."""
+
+        if self.view.change_count() != self.change_count or self.view.settings().get('syntax') != self.syntax:
+            self.clear()
+
+    def verify(self, pt, scope):
+        """Drop the lines from the one containing the point on, if the point's indexed scope is not its live `scope`."""
+
+        i = bisect.bisect_right(self.begins, pt) - 1
+        if i >= 0 and pt < self.lines[i].end:
+            line = self.lines[i]
+            if self.names[line.scopes[bisect.bisect_right(line.starts, pt) - 1]] != scope:
+                del self.begins[i:]
+                del self.lines[i:]
+
+    def invalidate(self, pt):
+        """Drop the lines from the one containing the modified point on."""
+
+        i = max(0, bisect.bisect_right(self.begins, pt) - 1)
+        if i < len(self.lines) and self.lines[i].end <= pt:
+            i += 1
+        del self.begins[i:]
+        del self.lines[i:]
+        self.change_count = self.view.change_count()
+        self.length = self.view.size()
+
+    def intern(self, scope):
+        """Get the id of the scope."""
+
+        scope_id = self.ids.get(scope)
+        if scope_id is None:
+            scope_id = self.ids[scope] = len(self.names)
+            self.names.append(scope)
+        return scope_id
+
+    def size(self):
+        """Get the size of the view."""
+
+        return self.length
+
+    def line(self, pt):
+        """Get the line, or the chunk of a long line, containing the point, building it if it is not indexed."""
+
+        i = bisect.bisect_right(self.begins, pt) - 1
+        if i >= 0 and pt < self.lines[i].end:
+            return self.lines[i]
+
+        if len(self.lines) >= self.max_lines:
+            del self.begins[:]
+            del self.lines[:]
+
+        region = self.view.line(pt)
+        begin = region.begin()
+        end = min(region.end() + 1, self.length)
+        if end - begin > self.chunk_size:
+            begin += (pt - begin) // self.chunk_size * self.chunk_size
+            end = min(begin + self.chunk_size, end)
+        starts = []
+        scopes = []
+        for point in range(begin, end):
+            scope_id = self.intern(self.view.scope_name(point))
+            if not scopes or scopes[-1] != scope_id:
+                starts.append(point)
+                scopes.append(scope_id)
+        line = Line(begin, end, starts, scopes)
+
+        i = bisect.bisect_left(self.begins, begin)
+        self.begins.insert(i, begin)
+        self.lines.insert(i, line)
+        return line
+
+    def token(self, pt):
+        """Get the start and end of the token containing the character at the point."""
+
+        line = self.line(pt)
+        i = bisect.bisect_right(line.starts, pt) - 1
+        end = line.starts[i + 1] if i + 1 < len(line.starts) else line.end
+        return line.starts[i], end
+
+    def scope_id(self, pt):
+        """Get the scope id of the character at the point."""
+
+        line = self.line(pt)
+        return line.scopes[bisect.bisect_right(line.starts, pt) - 1]
+
+    def scope_name(self, pt):
+        """Get the scope at the point."""
+
+        if pt >= self.length:
+            return self.view.scope_name(pt)
+        return self.names[self.scope_id(pt)]
+
+    def match_selector(self, pt, selector):
+        """Check if the selector matches the scope at the point, asking the view once per scope."""
+
+        if pt >= self.length:
+            return self.view.match_selector(pt, selector)
+        key = (self.scope_id(pt), selector)
+        match = self.matched.get(key)
+        if match is None:
+            if len(self.matched) >= self.max_matches:
+                self.matched.clear()
+            match = self.matched[key] = self.view.match_selector(pt, selector)
+        return match
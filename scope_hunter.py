@@ -6,24 +6,73 @@ Copyright (c) 2012 - 2016 Isaac Muse <isaacmuse@gmail.com>
 """
 import sublime
 import sublime_plugin
-from time import time, sleep
+from time import time
 import threading
+import os
+from collections import namedtuple, OrderedDict
 from ScopeHunter.scope_hunter_notify import notify, error
 import traceback
 from textwrap import dedent
 from ScopeHunter.lib.color_scheme_matcher import ColorSchemeMatcher
+from ScopeHunter.lib.lru_cache import LRUCache
+from ScopeHunter.lib.moving_percentile import MovingPercentile
+from ScopeHunter.lib.scope_extent import find_extent
+from ScopeHunter.lib.token_index import TokenIndex
+from ScopeHunter.lib.selection_result import SelectionResult, is_transparent, MORE
 
 TOOLTIP_SUPPORT = int(sublime.version()) >= 3124
 
+# Instant scoper delay when not adapted to the payload cost,
+# and the number of recent payload costs the delay is adapted to.
+DEFAULT_WAIT_TIME = 0.12
+DEBOUNCE_SAMPLES = 20
+
+# Max number of color box previews cached.
+COLOR_BOX_CACHE_SIZE = 256
+
+# Text commands that only modify the view at, or right before, the selections.
+# Any other modification, such as a revert or a reload from disk, drops the whole token index.
+SELECTION_EDITS = frozenset(
+    ('insert', 'left_delete', 'right_delete', 'delete_word', 'insert_snippet', 'paste', 'cut', 'commit_completion')
+)
+
 _lock = threading.Lock()
 
 if TOOLTIP_SUPPORT:
     import mdpopups
+    from ScopeHunter.lib.popup_template import PopupTemplate
+
+    # Popup templates by popup format, each compiled the first time a popup is rendered in its format.
+    # The Markdown template is converted to HTML by mdpopups, the HTML template is used as is.
+    popup_templates = {
+        'markdown': PopupTemplate(
+            lambda: sublime.load_resource('Packages/ScopeHunter/popup.j2'),
+            trim_blocks=True, lstrip_blocks=True
+        ),
+        'html': PopupTemplate(
+            lambda: sublime.load_resource('Packages/ScopeHunter/popup_html.j2'),
+            trim_blocks=True, lstrip_blocks=True, autoescape=True
+        )
+    }
+    # Popup tails converted to HTML.
+    popup_tails = {}
 
 if 'sh_thread' not in globals():
     sh_thread = None
 
-scheme_matcher = None
+# Color scheme matchers, and the settings they were created with, by scheme.
+scheme_matchers = LRUCache(4, on_evict=lambda scheme_file, entry: entry[0].save_results())
+# Matchers being set up by scheme.
+scheme_builds = {}
+# The settings that setting up a matcher failed with, by scheme, so it is not retried until reloaded.
+scheme_failures = {}
+# Token indexes by view id.
+token_indexes = {}
+# The HTML, the selection scoper handling the links, and the line and extent of the selection
+# it was shown for, of the open popup by view id.
+popups = {}
+# Color box previews by colors, borders, and size.
+color_boxes = LRUCache(COLOR_BOX_CACHE_SIZE)
 sh_settings = {}
 
 if TOOLTIP_SUPPORT:
@@ -52,35 +101,6 @@ RELOAD = '''
 '''
 
 
-# Text Entry
-ENTRY = "%-30s %s"
-SCOPE_KEY = "Scope"
-PTS_KEY = "Scope Extents (Pts)"
-PTS_VALUE = "(%d, %d)"
-CHAR_LINE_KEY = "Scope Extents (Line/Char)"
-CHAR_LINE_VALUE = "(line: %d char: %d, line: %d char: %d)"
-FG_KEY = "Fg"
-FG_SIM_KEY = "Fg (Simulated Alpha)"
-BG_KEY = "Bg"
-BG_SIM_KEY = "Bg (Simulated Alpha)"
-STYLE_KEY = "Style"
-FG_NAME_KEY = "Fg Name"
-FG_SCOPE_KEY = "Fg Scope"
-BG_NAME_KEY = "Bg Name"
-BG_SCOPE_KEY = "Bg Scope"
-BOLD_NAME_KEY = "Bold Name"
-BOLD_SCOPE_KEY = "Bold Scope"
-ITALIC_NAME_KEY = "Italic Name"
-ITALIC_SCOPE_KEY = "Italic Scope"
-SCHEME_KEY = "tmTheme File"
-SYNTAX_KEY = "Syntax File"
-OVERRIDE_SCHEME_KEY = "Scheme"
-HASHED_FG_KEY = "Hashed Fg"
-HASHED_FG_SIM_KEY = "Hashed Fg (Simulated Alpha)"
-HASHED_FG_NAME_KEY = "Hashed Fg Name"
-HASHED_FG_SCOPE_KEY = "Hashed Fg Scope"
-
-
 def log(msg):
     """Logging."""
     print("ScopeHunter: %s" % msg)
@@ -130,18 +150,6 @@ def underline(regions):
     return new_regions
 
 
-def copy_data(bfr, label, index, copy_format=None):
-    """Copy data to clipboard from buffer."""
-
-    line = bfr[index]
-    if line.startswith(label + ':'):
-        text = line.replace(label + ':', '', 1).strip()
-        if copy_format is not None:
-            text = copy_format(text)
-        sublime.set_clipboard(text)
-        notify("Copied: %s" % label)
-
-
 class ScopeHunterEditCommand(sublime_plugin.TextCommand):
     """Edit a view."""
 
@@ -162,28 +170,37 @@ class ScopeHunterEditCommand(sublime_plugin.TextCommand):
         cls.pt = None
 
 
-class GetSelectionScope(object):
-    """Get the scope and the selection(s)."""
+class SelectionInfo(namedtuple('SelectionInfo', ['pt', 'scope', 'extent', 'rowcol', 'count'])):
+    """
+    The scope, and the scope extent and its start and end row and column, of a selection.
+
+    When selections are aggregated, it is the first of `count` selections with the same scope.
+    """
 
-    def init_template_vars(self):
-        """Initialize template variables."""
 
-        self.template_vars = {}
+class GetSelectionScope(object):
+    """Get the scope and the selection(s)."""
 
-    def next_index(self):
-        """Get next index into scope buffer."""
+    # What the output depends on, besides the selections, as read from the view and the settings.
+    OPTIONS = (
+        'color_scheme', 'syntax', 'box_height', 'show_statusbar', 'show_panel', 'show_popup', 'popup_format',
+        'clipboard', 'multiselect', 'multiselect_aggregate', 'multiselect_max_groups', 'console_log',
+        'highlight_extent', 'highlight_scope', 'highlight_style', 'highlight_max_size', 'extent_search_window',
+        'rowcol_info', 'points_info', 'appearance_info', 'show_simulated', 'file_path_info', 'selector_info'
+    )
 
-        self.index += 1
-        return self.index
+    # What `render` produces.
+    RENDERED = (
+        'results', 'scope_bfr_tool', 'popup_tail', 'scheme_file', 'syntax_file', 'overrides', 'scheme_info',
+        'scheme_matcher'
+    )
 
-    def get_color_box(self, color, key, index):
+    def get_color_box(self, template_vars, color, key, index):
         """Display an HTML color box using the given color."""
 
         border = '#CCCCCC'
         border2 = '#333333'
-        padding = int(self.view.settings().get('line_padding_top', 0))
-        padding += int(self.view.settings().get('line_padding_bottom', 0))
-        box_height = int(self.view.line_height()) - padding - 2
+        box_height = self.box_height
         check_size = int((box_height - 4) / 4)
         if isinstance(color, list):
             box_width = box_height * (len(color) if len(color) >= 1 else 1)
@@ -193,123 +210,148 @@ class GetSelectionScope(object):
             colors = [color.upper()]
         if check_size < 2:
             check_size = 2
-        self.template_vars['%s_preview' % key] = mdpopups.color_box(
-            colors, border, border2, height=box_height,
-            width=box_width, border_size=2, check_size=check_size
-        )
-        self.template_vars['%s_color' % key] = ', '.join(colors)
-        self.template_vars['%s_index' % key] = index
+        box_key = (tuple(colors), border, border2, box_height, box_width, check_size)
+        preview = color_boxes.get(box_key)
+        if preview is None:
+            preview = mdpopups.color_box(
+                colors, border, border2, height=box_height,
+                width=box_width, border_size=2, check_size=check_size
+            )
+            color_boxes.set(box_key, preview)
+        template_vars['%s_preview' % key] = preview
+        template_vars['%s_color' % key] = ', '.join(colors)
+        template_vars['%s_index' % key] = index
+
+    def read_extent(self, index, pt, scope_name):
+        """
+        Get the scope extent, and its start and end row and column, via the sublime API.
 
-    def get_extents(self, pt):
-        """Get the scope extent via the sublime API."""
+        The extent is searched for around the point, a token at a time via the view's
+        token index, and the whole file is only searched if the extent reaches the search window.
+        If the extent is only needed for the highlight, the window is capped to the highlight's
+        max size, and an extent that reaches it is not highlighted instead of searched for.
+        """
 
         pts = None
-        file_end = self.view.size()
-        scope_name = self.view.scope_name(pt)
-        for r in self.view.find_by_selector(scope_name):
-            if r.contains(pt):
-                pts = r
-                break
-            elif pt == file_end and r.end() == pt:
-                pts = r
-                break
+        extent = None
+        window = self.extent_search_window
+        highlight_only = not self.rowcol_info and not self.points_info
+        if highlight_only and (window <= 0 or window > self.highlight_max_size):
+            window = self.highlight_max_size
+        if window > 0:
+            extent = find_extent(index, pt, scope_name, window, index.token)
+        if extent is not None:
+            pts = sublime.Region(*extent)
+        elif not highlight_only:
+            file_end = self.view.size()
+            for r in self.view.find_by_selector(scope_name):
+                if r.contains(pt):
+                    pts = r
+                    break
+                elif pt == file_end and r.end() == pt:
+                    pts = r
+                    break
 
         if pts is None:
             pts = sublime.Region(pt)
 
-        row1, col1 = self.view.rowcol(pts.begin())
-        row2, col2 = self.view.rowcol(pts.end())
-
-        # Scale back the extent by one for true points included
-        if pts.size() < self.highlight_max_size:
-            self.extents.append(sublime.Region(pts.begin(), pts.end()))
+        return pts, self.view.rowcol(pts.begin()) + self.view.rowcol(pts.end())
 
-        if self.points_info or self.rowcol_info:
-            if self.points_info:
-                self.scope_bfr.append(ENTRY % (PTS_KEY + ':', PTS_VALUE % (pts.begin(), pts.end())))
-            if self.rowcol_info:
-                self.scope_bfr.append(
-                    ENTRY % (CHAR_LINE_KEY + ':', CHAR_LINE_VALUE % (row1 + 1, col1 + 1, row2 + 1, col2 + 1))
-                )
-
-            if self.show_popup:
-                if self.points_info:
-                    self.template_vars["pt_extent"] = True
-                    self.template_vars["extent_start"] = pts.begin()
-                    self.template_vars["extent_end"] = pts.end()
-                    self.template_vars["extent_pt_index"] = self.next_index()
-                if self.rowcol_info:
-                    self.template_vars["rowcol_extent"] = True
-                    self.template_vars["l_start"] = row1 + 1
-                    self.template_vars["l_end"] = row2 + 1
-                    self.template_vars["c_start"] = col1 + 1
-                    self.template_vars["c_end"] = col2 + 1
-                    self.template_vars["line_char_index"] = self.next_index()
-
-    def get_scope(self, pt):
-        """Get the scope at the cursor."""
-
-        scope = self.view.scope_name(pt)
-        spacing = "\n" + (" " * 31)
-
-        if self.clipboard:
-            self.clips.append(scope)
-
-        if self.first and self.show_statusbar:
-            self.status = scope
-            self.first = False
-
-        self.scope_bfr.append(ENTRY % (SCOPE_KEY + ':', self.view.scope_name(pt).strip().replace(" ", spacing)))
-
-        if self.show_popup:
-            self.template_vars['scope'] = self.view.scope_name(pt).strip()
-            self.template_vars['scope_index'] = self.next_index()
-
-        return scope
-
-    def get_appearance(self, color, color_sim, bgcolor, bgcolor_sim, style, color_gradient):
-        """Get colors of foreground, background, and simulated transparency colors."""
-
-        self.scope_bfr.append(ENTRY % (FG_KEY + ":", color))
-        if self.show_simulated and len(color) == 9 and not color.lower().endswith('ff'):
-            self.scope_bfr.append(ENTRY % (FG_SIM_KEY + ":", color_sim))
+    def get_scheme_syntax(self):
+        """Get color scheme and syntax file path."""
 
-        colors = []
-        colors_sim = []
-        show_sim = False
-        if color_gradient:
-            for c, cs in color_gradient:
-                colors.append(c)
-                if len(cs) == 9 and not cs.lower().endswith('ff'):
-                    show_sim = True
-                colors_sim.append(cs)
-            self.scope_bfr.append(ENTRY % (HASHED_FG_KEY + ":", ', '.join(colors)))
-            if self.show_simulated and show_sim:
-                self.scope_bfr.append(ENTRY % (HASHED_FG_SIM_KEY + ":", ', '.join(colors_sim)))
+        self.overrides = self.scheme_matcher.overrides
 
-        self.scope_bfr.append(ENTRY % (BG_KEY + ":", bgcolor))
-        if self.show_simulated and len(bgcolor) == 9 and not bgcolor.lower().endswith('ff'):
-            self.scope_bfr.append(ENTRY % (BG_SIM_KEY + ":", bgcolor_sim))
+        self.scheme_file = self.scheme_matcher.color_scheme.replace('\\', '/')
+        is_tmtheme = not self.scheme_file.endswith(('.sublime-color-scheme', '.hidden-color-scheme'))
+        self.syntax_file = self.syntax
+        return self.syntax_file, self.scheme_file if is_tmtheme else None, self.overrides
 
-        self.scope_bfr.append(ENTRY % (STYLE_KEY + ":", "normal" if not style else style))
+    def get_matches(self):
+        """Match the colors and styles of the selections' scopes, matching each distinct scope once."""
 
-        if self.show_popup:
-            self.template_vars['appearance'] = True
-            self.get_color_box(color, 'fg', self.next_index())
-            if self.show_simulated and len(color) == 9 and not color.lower().endswith('ff'):
-                self.template_vars['fg_sim'] = True
-                self.get_color_box(color_sim, 'fg_sim', self.next_index())
-            if color_gradient:
-                self.template_vars['fg_hash'] = True
-                self.get_color_box(colors, 'fg_hash', self.next_index())
-                if self.show_simulated and show_sim:
-                    self.template_vars['fg_hash_sim'] = True
-                    self.get_color_box(colors_sim, 'fg_hash_sim', self.next_index())
-            self.get_color_box(bgcolor, 'bg', self.next_index())
-            if self.show_simulated and len(bgcolor) == 9 and not bgcolor.lower().endswith('ff'):
-                self.template_vars['bg_sim'] = True
-                self.get_color_box(bgcolor_sim, 'bg_sim', self.next_index())
+        if (self.appearance_info or self.selector_info) and self.scheme_matcher is not None:
+            try:
+                # if match.color_gradient is not None:
+                #     color = self.view.style_for_scope(scope)["foreground"]
+                #     color_sim = color
 
+                return self.scheme_matcher.guess_colors([info.scope for info in self.selections])
+            except Exception:
+                log("Evaluating theme failed!  Ignoring theme related info.")
+                debug(str(traceback.format_exc()))
+                error("Evaluating theme failed!")
+                self.scheme_info = False
+        return [None] * len(self.selections)
+
+    def get_info(self, info, match, files):
+        """Get the result of a selection, with what is shown of it."""
+
+        result = SelectionResult(info.scope, count=info.count)
+
+        if self.points_info:
+            result.points = (info.extent.begin(), info.extent.end())
+        if self.rowcol_info:
+            result.rowcol = info.rowcol
+
+        if match is not None:
+            if self.appearance_info:
+                result.appearance = match
+            if self.selector_info:
+                result.selectors = match
+
+        result.files = files
+        return result
+
+    def get_text(self):
+        """Get the lines of the text output."""
+
+        lines = []
+        for result in self.results:
+            lines.extend(result.text(self.show_simulated))
+        if self.more is not None:
+            lines.append(MORE % self.more)
+        return lines
+
+    def render_popup(self, result, index):
+        """Render the popup output of a selection, whose links refer to it by index."""
+
+        template_vars = {'scope': result.scope.strip(), 'scope_index': index}
+        if result.count > 1:
+            template_vars['count'] = result.count
+
+        if result.points is not None:
+            template_vars["pt_extent"] = True
+            template_vars["extent_start"], template_vars["extent_end"] = result.points
+            template_vars["extent_pt_index"] = index
+        if result.rowcol is not None:
+            row1, col1, row2, col2 = result.rowcol
+            template_vars["rowcol_extent"] = True
+            template_vars["l_start"] = row1 + 1
+            template_vars["l_end"] = row2 + 1
+            template_vars["c_start"] = col1 + 1
+            template_vars["c_end"] = col2 + 1
+            template_vars["line_char_index"] = index
+
+        colors = result.appearance
+        if colors is not None:
+            template_vars['appearance'] = True
+            self.get_color_box(template_vars, colors.fg, 'fg', index)
+            if self.show_simulated and is_transparent(colors.fg):
+                template_vars['fg_sim'] = True
+                self.get_color_box(template_vars, colors.fg_simulated, 'fg_sim', index)
+            if colors.color_gradient:
+                template_vars['fg_hash'] = True
+                self.get_color_box(template_vars, [c for c, cs in colors.color_gradient], 'fg_hash', index)
+                if self.show_simulated and any(is_transparent(cs) for c, cs in colors.color_gradient):
+                    template_vars['fg_hash_sim'] = True
+                    self.get_color_box(template_vars, [cs for c, cs in colors.color_gradient], 'fg_hash_sim', index)
+            self.get_color_box(template_vars, colors.bg, 'bg', index)
+            if self.show_simulated and is_transparent(colors.bg):
+                template_vars['bg_sim'] = True
+                self.get_color_box(template_vars, colors.bg_simulated, 'bg_sim', index)
+
+            style = colors.style
             tag = None
             tag2 = None
             style_label = set()
@@ -332,139 +374,58 @@ class GetSelectionScope(object):
                 tag = "span"
             if tag2 is None:
                 tag2 = "span"
-            self.template_vars["style_tag2"] = tag2
-            self.template_vars["style_tag"] = tag
-            self.template_vars["style"] = ' '.join(list(style_label))
-            self.template_vars["style_index"] = self.next_index()
-
-    def get_scheme_syntax(self):
-        """Get color scheme and syntax file path."""
-
-        self.overrides = scheme_matcher.overrides
-
-        self.scheme_file = scheme_matcher.color_scheme.replace('\\', '/')
-        is_tmtheme = not self.scheme_file.endswith(('.sublime-color-scheme', '.hidden-color-scheme'))
-        self.syntax_file = self.view.settings().get('syntax')
-        self.scope_bfr.append(ENTRY % (SYNTAX_KEY + ":", self.syntax_file))
-        if is_tmtheme:
-            self.scope_bfr.append(ENTRY % (SCHEME_KEY + ":", self.scheme_file))
-        text = []
-        for idx, override in enumerate(self.overrides, 1):
-            text.append(ENTRY % (OVERRIDE_SCHEME_KEY + (" %d:" % idx), override))
-        self.scope_bfr.append('\n'.join(text))
-
-        if self.show_popup:
-            self.template_vars['files'] = True
-            self.template_vars["syntax"] = self.syntax_file
-            self.template_vars["syntax_index"] = self.next_index()
-            if is_tmtheme:
-                self.template_vars["scheme"] = self.scheme_file
-                self.template_vars["scheme_index"] = self.next_index()
-            self.template_vars["overrides"] = self.overrides
-            self.template_vars["overrides_index"] = self.next_index()
-
-    def get_selectors(self, color_selector, bg_selector, style_selectors, color_gradient_selector):
-        """Get the selectors used to determine color and/or style."""
-
-        self.scope_bfr.append(ENTRY % (FG_NAME_KEY + ":", color_selector.name))
-        self.scope_bfr.append(ENTRY % (FG_SCOPE_KEY + ":", color_selector.scope))
-        if color_gradient_selector:
-            self.scope_bfr.append(ENTRY % (HASHED_FG_NAME_KEY + ":", color_gradient_selector.name))
-            self.scope_bfr.append(ENTRY % (HASHED_FG_SCOPE_KEY + ":", color_gradient_selector.scope))
-        self.scope_bfr.append(ENTRY % (BG_NAME_KEY + ":", bg_selector.name))
-        self.scope_bfr.append(ENTRY % (BG_SCOPE_KEY + ":", bg_selector.scope))
-        if style_selectors["bold"].name != "" or style_selectors["bold"].scope != "":
-            self.scope_bfr.append(ENTRY % (BOLD_NAME_KEY + ":", style_selectors["bold"].name))
-            self.scope_bfr.append(ENTRY % (BOLD_SCOPE_KEY + ":", style_selectors["bold"].scope))
-
-        if style_selectors["italic"].name != "" or style_selectors["italic"].scope != "":
-            self.scope_bfr.append(ENTRY % (ITALIC_NAME_KEY + ":", style_selectors["italic"].name))
-            self.scope_bfr.append(ENTRY % (ITALIC_SCOPE_KEY + ":", style_selectors["italic"].scope))
-
-        if self.show_popup:
-            self.template_vars['selectors'] = True
-            self.template_vars['fg_name'] = color_selector.name
-            self.template_vars['fg_name_index'] = self.next_index()
-            self.template_vars['fg_scope'] = color_selector.scope
-            self.template_vars['fg_scope_index'] = self.next_index()
-            if color_gradient_selector:
-                self.template_vars['fg_hash_name'] = color_gradient_selector.name
-                self.template_vars['fg_hash_name_index'] = self.next_index()
-                self.template_vars['fg_hash_scope'] = color_gradient_selector.scope
-                self.template_vars['fg_hash_scope_index'] = self.next_index()
-            self.template_vars['bg_name'] = bg_selector.name
-            self.template_vars['bg_name_index'] = self.next_index()
-            self.template_vars['bg_scope'] = bg_selector.scope
-            self.template_vars['bg_scope_index'] = self.next_index()
-            if style_selectors["bold"].name != "" or style_selectors["bold"].scope != "":
-                self.template_vars['bold'] = True
-                self.template_vars['bold_name'] = style_selectors["bold"].name
-                self.template_vars['bold_name_index'] = self.next_index()
-                self.template_vars['bold_scope'] = style_selectors["bold"].scope
-                self.template_vars['bold_scope_index'] = self.next_index()
-            if style_selectors["italic"].name != "" or style_selectors["italic"].scope != "":
-                self.template_vars['italic'] = True
-                self.template_vars['italic_name'] = style_selectors["italic"].name
-                self.template_vars['italic_name_index'] = self.next_index()
-                self.template_vars['italic_scope'] = style_selectors["italic"].scope
-                self.template_vars['italic_scope_index'] = self.next_index()
-
-    def get_info(self, pt):
-        """Get scope related info."""
-
-        scope = self.get_scope(pt)
-
-        if self.rowcol_info or self.points_info or self.highlight_extent:
-            self.get_extents(pt)
-
-        if (self.appearance_info or self.selector_info) and scheme_matcher is not None:
-            try:
-                match = scheme_matcher.guess_color(scope)
-                color = match.fg
-                bgcolor = match.bg
-                color_sim = match.fg_simulated
-                bgcolor_sim = match.bg_simulated
-                style = match.style
-                bg_selector = match.bg_selector
-                color_selector = match.fg_selector
-                style_selectors = match.style_selectors
-                color_gradient = match.color_gradient
-                color_gradient_selector = match.color_gradient_selector
-
-                # if match.color_gradient is not None:
-                #     color = self.view.style_for_scope(scope)["foreground"]
-                #     color_sim = color
-
-                if self.appearance_info:
-                    self.get_appearance(color, color_sim, bgcolor, bgcolor_sim, style, color_gradient)
-
-                if self.selector_info:
-                    self.get_selectors(color_selector, bg_selector, style_selectors, color_gradient_selector)
-            except Exception:
-                log("Evaluating theme failed!  Ignoring theme related info.")
-                debug(str(traceback.format_exc()))
-                error("Evaluating theme failed!")
-                self.scheme_info = False
-
-        if self.file_path_info and scheme_matcher:
-            self.get_scheme_syntax()
-
-        # Divider
-        self.next_index()
-        self.scope_bfr.append("------")
-
-        if self.show_popup:
-            self.scope_bfr_tool.append(
-                mdpopups.md2html(
-                    self.view,
-                    self.popup_template,
-                    template_vars=self.template_vars,
-                    template_env_options={
-                        "trim_blocks": True,
-                        "lstrip_blocks": True
-                    }
-                )
-            )
+            template_vars["style_tag2"] = tag2
+            template_vars["style_tag"] = tag
+            template_vars["style"] = ' '.join(list(style_label))
+            template_vars["style_index"] = index
+
+        colors = result.selectors
+        if colors is not None:
+            template_vars['selectors'] = True
+            template_vars['fg_name'] = colors.fg_selector.name
+            template_vars['fg_name_index'] = index
+            template_vars['fg_scope'] = colors.fg_selector.scope
+            template_vars['fg_scope_index'] = index
+            if colors.color_gradient_selector:
+                template_vars['fg_hash_name'] = colors.color_gradient_selector.name
+                template_vars['fg_hash_name_index'] = index
+                template_vars['fg_hash_scope'] = colors.color_gradient_selector.scope
+                template_vars['fg_hash_scope_index'] = index
+            template_vars['bg_name'] = colors.bg_selector.name
+            template_vars['bg_name_index'] = index
+            template_vars['bg_scope'] = colors.bg_selector.scope
+            template_vars['bg_scope_index'] = index
+            for style in ('bold', 'italic'):
+                selector = colors.style_selectors[style]
+                if selector.name != "" or selector.scope != "":
+                    template_vars[style] = True
+                    template_vars['%s_name' % style] = selector.name
+                    template_vars['%s_name_index' % style] = index
+                    template_vars['%s_scope' % style] = selector.scope
+                    template_vars['%s_scope_index' % style] = index
+
+        if result.files is not None:
+            template_vars['files'] = True
+            template_vars["syntax"], scheme, template_vars["overrides"] = result.files
+            template_vars["syntax_index"] = index
+            if scheme is not None:
+                template_vars["scheme"] = scheme
+                template_vars["scheme_index"] = index
+            template_vars["overrides_index"] = index
+
+        text = popup_templates[self.popup_format].render(plugin=template_vars)
+        if self.popup_format == 'markdown':
+            text = mdpopups.md2html(self.view, text)
+        return text
+
+    def copy_entry(self, link, index):
+        """Copy an entry of a selection's result to the clipboard."""
+
+        entry = self.results[index].lookup(link, self.show_simulated)
+        if entry is not None:
+            label, value = entry
+            sublime.set_clipboard(value)
+            notify("Copied: %s" % label)
 
     def on_navigate(self, href):
         """Exceute link callback."""
@@ -477,59 +438,12 @@ class GetSelectionScope(object):
             reinit_plugin()
             self.view.run_command('get_selection_scope')
         if key == 'copy-all':
-            sublime.set_clipboard('\n'.join(self.scope_bfr))
+            sublime.set_clipboard('\n'.join(self.get_text()))
             notify('Copied: All')
-        elif key == 'copy-scope':
-            copy_data(
-                self.scope_bfr,
-                SCOPE_KEY,
-                index,
-                lambda x: x.replace('\n' + ' ' * 31, ' ')
-            )
-        elif key == 'copy-points':
-            copy_data(self.scope_bfr, PTS_KEY, index)
-        elif key == 'copy-line-char':
-            copy_data(self.scope_bfr, CHAR_LINE_KEY, index)
-        elif key == 'copy-fg':
-            copy_data(self.scope_bfr, FG_KEY, index)
-        elif key == 'copy-fg-sim':
-            copy_data(self.scope_bfr, FG_SIM_KEY, index)
-        elif key == 'copy-fg-hash':
-            copy_data(self.scope_bfr, HASHED_FG_KEY, index)
-        elif key == 'copy-fg-hash-sim':
-            copy_data(self.scope_bfr, HASHED_FG_SIM_KEY, index)
-        elif key == 'copy-bg':
-            copy_data(self.scope_bfr, BG_KEY, index)
-        elif key == 'copy-bg-sim':
-            copy_data(self.scope_bfr, BG_SIM_KEY, index)
-        elif key == 'copy-style':
-            copy_data(self.scope_bfr, STYLE_KEY, index)
-        elif key == 'copy-fg-sel-name':
-            copy_data(self.scope_bfr, FG_NAME_KEY, index)
-        elif key == 'copy-fg-sel-scope':
-            copy_data(self.scope_bfr, FG_SCOPE_KEY, index)
-        elif key == 'copy-fg-hash-sel-name':
-            copy_data(self.scope_bfr, HASHED_FG_NAME_KEY, index)
-        elif key == 'copy-fg-hash-sel-scope':
-            copy_data(self.scope_bfr, HASHED_FG_SCOPE_KEY, index)
-        elif key == 'copy-bg-sel-name':
-            copy_data(self.scope_bfr, BG_NAME_KEY, index)
-        elif key == 'copy-bg-sel-scope':
-            copy_data(self.scope_bfr, BG_SCOPE_KEY, index)
-        elif key == 'copy-bold-sel-name':
-            copy_data(self.scope_bfr, BOLD_NAME_KEY, index)
-        elif key == 'copy-bold-sel-scope':
-            copy_data(self.scope_bfr, BOLD_SCOPE_KEY, index)
-        elif key == 'copy-italic-sel-name':
-            copy_data(self.scope_bfr, ITALIC_NAME_KEY, index)
-        elif key == 'copy-italic-sel-scope':
-            copy_data(self.scope_bfr, ITALIC_SCOPE_KEY, index)
-        elif key == 'copy-scheme':
-            copy_data(self.scope_bfr, SCHEME_KEY, index)
-        elif key == 'copy-syntax':
-            copy_data(self.scope_bfr, SYNTAX_KEY, index)
         elif key == 'copy-overrides':
-            copy_data(self.scope_bfr, OVERRIDE_SCHEME_KEY, index, lambda text: self.overrides[int(params[2]) - 1])
+            self.copy_entry('%s:%s' % (key, params[2]), index)
+        elif key.startswith('copy-'):
+            self.copy_entry(key, index)
         elif key == 'scheme' and self.scheme_file is not None:
             window = self.view.window()
             window.run_command(
@@ -559,32 +473,65 @@ class GetSelectionScope(object):
                 }
             )
 
-    def run(self, v):
-        """Run ScopeHunter and display in the approriate way."""
+    def run(self, v, cancelled=None):
+        """
+        Run ScopeHunter and display in the approriate way.
 
+        `cancelled` is checked between each phase, and if it returns `True`,
+        because a newer selection superseded this one, the run stops.
+        Returns `False` if the run was cancelled.
+
+        The run is split into `read`, `render`, and `show`.  Only `read` and
+        `show` need to run on the UI thread, so callers can run `render` on
+        a worker thread instead of calling `run`.
+        """
+
+        return self.read(v, cancelled) and self.render() and self.show()
+
+    def read(self, v, cancelled=None, previous=None):
+        """
+        Read the settings, and the scopes and extents of the selections, from the view.
+
+        If `previous` was run on the same view, with the same options and no changes to
+        the view since, a selection that is still within its previous extent and scope
+        reuses that extent, and if no selection changed, `render` reuses its output.
+        """
+
+        self.cancelled = cancelled if cancelled is not None else (lambda: False)
         self.view = v
+        self.view_id = self.view.id()
+        self.change_count = self.view.change_count()
+        self.reused = False
         self.window = self.view.window()
-        view = self.window.create_output_panel('scopehunter.results', unlisted=True)
-        self.scope_bfr = []
+        self.results = []
         self.scope_bfr_tool = []
-        self.clips = []
-        self.status = ""
-        self.popup_template = sublime.load_resource('Packages/ScopeHunter/popup.j2')
         self.scheme_file = None
         self.syntax_file = None
+        self.scheme_matcher = None
+        self.color_scheme = view_color_scheme(self.view)
+        self.syntax = self.view.settings().get('syntax')
+        padding = int(self.view.settings().get('line_padding_top', 0))
+        padding += int(self.view.settings().get('line_padding_bottom', 0))
+        self.box_height = int(self.view.line_height()) - padding - 2
         self.show_statusbar = bool(sh_settings.get("show_statusbar", False))
         self.show_panel = bool(sh_settings.get("show_panel", False))
         if TOOLTIP_SUPPORT:
             self.show_popup = bool(sh_settings.get("show_popup", False))
         else:
             self.show_popup = False
+        self.popup_format = sh_settings.get("popup_format", "markdown")
+        if self.popup_format not in ('markdown', 'html'):
+            self.popup_format = 'markdown'
         self.clipboard = bool(sh_settings.get("clipboard", False))
         self.multiselect = bool(sh_settings.get("multiselect", False))
+        self.multiselect_aggregate = bool(sh_settings.get("multiselect_aggregate", False))
+        self.multiselect_max_groups = int(sh_settings.get("multiselect_max_groups", 50))
         self.console_log = bool(sh_settings.get("console_log", False))
         self.highlight_extent = bool(sh_settings.get("highlight_extent", False))
         self.highlight_scope = sh_settings.get("highlight_scope", 'invalid')
         self.highlight_style = sh_settings.get("highlight_style", 'outline')
         self.highlight_max_size = int(sh_settings.get("highlight_max_size", 100))
+        self.extent_search_window = int(sh_settings.get("extent_search_window", 2000))
         self.rowcol_info = bool(sh_settings.get("extent_line_char", False))
         self.points_info = bool(sh_settings.get("extent_points", False))
         self.appearance_info = bool(sh_settings.get("styling", False))
@@ -592,72 +539,216 @@ class GetSelectionScope(object):
         self.file_path_info = bool(sh_settings.get("file_paths", False))
         self.selector_info = bool(sh_settings.get("selectors", False))
         self.scheme_info = self.appearance_info or self.selector_info
-        self.first = True
-        self.extents = []
+        self.options = tuple(getattr(self, name) for name in self.OPTIONS)
+
+        if previous is not None and (
+            previous.view_id != self.view_id or
+            previous.change_count != self.change_count or
+            previous.options != self.options
+        ):
+            previous = None
+        self.previous = previous
+
+        # Get scope for each selection wanted
+        self.selections = []
+        self.more = None
+        sels = self.view.sel()
+        if len(sels):
+            index = None
+            if self.rowcol_info or self.points_info or self.highlight_extent:
+                index = get_token_index(self.view)
+            aggregate = self.multiselect and self.multiselect_aggregate
+            groups = OrderedDict()
+            for sel in (sels if self.multiselect else [sels[0]]):
+                if self.cancelled():
+                    return False
+                pt = sel.b
+                scope = self.view.scope_name(pt)
+                if index is not None:
+                    index.verify(pt, scope)
+                if not aggregate:
+                    self.selections.append(self.read_selection(index, pt, scope, 1))
+                elif scope in groups:
+                    groups[scope][1] += 1
+                else:
+                    groups[scope] = [pt, 1]
+
+            if aggregate:
+                # Only the first selection of each group shown is read further.
+                groups = list(groups.items())
+                limit = self.multiselect_max_groups if self.multiselect_max_groups > 0 else len(groups)
+                for scope, (pt, count) in groups[:limit]:
+                    if self.cancelled():
+                        return False
+                    self.selections.append(self.read_selection(index, pt, scope, count))
+                if len(groups) > limit:
+                    self.more = (len(groups) - limit, sum(count for scope, (pt, count) in groups[limit:]))
+        return True
+
+    def read_selection(self, index, pt, scope, count):
+        """
+        Get the info of a selection, or of the first of `count` selections with the same scope.
+
+        The extent is only read if the view's token `index` is given.  The previous run's
+        extent is reused if the selection, at the same position, is still within it.
+        """
+
+        extent = rowcol = None
+        if index is not None:
+            last = None
+            if self.previous is not None and len(self.selections) < len(self.previous.selections):
+                last = self.previous.selections[len(self.selections)]
+            if last is not None and last.scope == scope and last.extent.begin() <= pt <= last.extent.end():
+                # Still within the same extent
+                extent, rowcol = last.extent, last.rowcol
+            else:
+                extent, rowcol = self.read_extent(index, pt, scope)
+        return SelectionInfo(pt, scope, extent, rowcol, count)
+
+    def render(self):
+        """Match the colors and styles of the selections' scopes, and render the output."""
+
+        previous = self.previous
+        self.previous = None
+
+        if self.scheme_info or self.file_path_info:
+            self.scheme_matcher = get_scheme_matcher_for(self.color_scheme)
+
+        if (
+            previous is not None and
+            previous.scheme_matcher is self.scheme_matcher and
+            previous.more == self.more and
+            [info[1:] for info in previous.selections] == [info[1:] for info in self.selections]
+        ):
+            # Nothing shown changed, so reuse the previous output.
+            for name in self.RENDERED:
+                if hasattr(previous, name):
+                    setattr(self, name, getattr(previous, name))
+            self.reused = True
+            return not self.cancelled()
+
+        files = None
+        if self.file_path_info and self.scheme_matcher:
+            files = self.get_scheme_syntax()
 
         # Get scope info for each selection wanted
-        self.index = -1
-        if len(self.view.sel()):
-            if self.multiselect:
-                count = 0
-                for sel in self.view.sel():
-                    if count > 0 and self.show_popup:
-                        self.scope_bfr_tool.append('\n---\n')
-                    self.init_template_vars()
-                    self.get_info(sel.b)
-                    count += 1
+        matches = self.get_matches()
+        for info, match in zip(self.selections, matches):
+            if self.cancelled():
+                return False
+            self.results.append(self.get_info(info, match, files))
+
+        if self.show_popup:
+            for count, result in enumerate(self.results):
+                if self.cancelled():
+                    return False
+                if count > 0:
+                    self.scope_bfr_tool.append('\n---\n')
+                self.scope_bfr_tool.append(self.render_popup(result, count))
+            if self.more is not None:
+                self.scope_bfr_tool.append('\n---\n')
+                self.scope_bfr_tool.append('<p class="small">%s</p>' % (MORE % self.more))
+
+            if self.cancelled():
+                return False
+            if self.scheme_info or self.rowcol_info or self.points_info or self.file_path_info:
+                self.popup_tail = get_popup_tail(self.view, COPY_ALL)
             else:
-                self.init_template_vars()
-                self.get_info(self.view.sel()[0].b)
+                self.popup_tail = get_popup_tail(self.view, RELOAD)
+
+        return not self.cancelled()
+
+    def show(self):
+        """Display the rendered output."""
+
+        if self.cancelled():
+            return False
+
+        # A reused output is still in the panel
+        if not self.reused:
+            view = self.window.create_output_panel('scopehunter.results', unlisted=True)
 
         # Copy scopes to clipboard
         if self.clipboard:
-            sublime.set_clipboard('\n'.join(self.clips))
+            sublime.set_clipboard('\n'.join(info.scope for info in self.selections))
 
         # Display in status bar
         if self.show_statusbar:
-            sublime.status_message(self.status)
+            sublime.status_message(self.selections[0].scope if self.selections else "")
+
+        text = None
+        if (self.show_panel and not self.reused) or self.console_log:
+            text = self.get_text()
 
         # Show panel
         if self.show_panel:
-            ScopeHunterEditCommand.bfr = '\n'.join(self.scope_bfr)
-            ScopeHunterEditCommand.pt = 0
-            view.run_command('scope_hunter_edit')
-            ScopeHunterEditCommand.clear()
+            if not self.reused:
+                ScopeHunterEditCommand.bfr = '\n'.join(text)
+                ScopeHunterEditCommand.pt = 0
+                view.run_command('scope_hunter_edit')
+                ScopeHunterEditCommand.clear()
             self.window.run_command("show_panel", {"panel": "output.scopehunter.results"})
 
         if self.console_log:
-            print('\n'.join(["Scope Hunter"] + self.scope_bfr))
+            print('\n'.join(["Scope Hunter"] + text))
 
         if self.highlight_extent:
+            extents = [info.extent for info in self.selections if info.extent.size() < self.highlight_max_size]
             style = extent_style(self.highlight_style)
             if style == 'underline':
-                self.extents = underline(self.extents)
+                extents = underline(extents)
             self.view.add_regions(
                 'scope_hunter',
-                self.extents,
+                extents,
                 self.highlight_scope,
                 '',
                 style
             )
 
         if self.show_popup:
-            if self.scheme_info or self.rowcol_info or self.points_info or self.file_path_info:
-                tail = mdpopups.md2html(self.view, COPY_ALL)
+            if self.cancelled():
+                return False
+
+            html = ''.join(self.scope_bfr_tool) + self.popup_tail
+            sel = self.selections[0] if self.selections else None
+            popup = popups.get(self.view_id)
+            if popup is None:
+                moved = True
+            elif sel is None or popup[2] is None:
+                moved = sel is not None or popup[2] is not None
             else:
-                tail = mdpopups.md2html(self.view, RELOAD)
-
-            mdpopups.show_popup(
-                self.view,
-                ''.join(self.scope_bfr_tool) + tail,
-                md=False,
-                css=ADD_CSS,
-                wrapper_class=('scope-hunter'),
-                max_width=1000, on_navigate=self.on_navigate,
-            )
-
+                # The popup stays while the caret is on the same line, or in the same extent.
+                line, extent = popup[2]
+                moved = not line.contains(sel.pt) and (extent is None or not extent.contains(sel.pt))
+            if moved:
+                # Show the popup at the caret, replacing a popup shown for another line and extent.
+                area = (self.view.line(sel.pt), sel.extent) if sel is not None else None
+                popup = popups[self.view_id] = [html, self, area]
+                mdpopups.show_popup(
+                    self.view,
+                    html,
+                    md=False,
+                    css=ADD_CSS,
+                    wrapper_class=('scope-hunter'),
+                    max_width=1000,
+                    on_navigate=lambda href, popup=popup: popup[1].on_navigate(href),
+                    on_hide=lambda view_id=self.view_id, popup=popup: popup_hidden(view_id, popup)
+                )
+            elif popup[0] != html:
+                # Update the open popup in place, instead of hiding it and showing a new one.
+                popup[:2] = [html, self]
+                mdpopups.update_popup(
+                    self.view,
+                    html,
+                    md=False,
+                    css=ADD_CSS,
+                    wrapper_class=('scope-hunter')
+                )
+            else:
+                # The open popup shows the same output, so only take over its links.
+                popup[1] = self
 
-get_selection_scopes = GetSelectionScope()
+        return True
 
 
 class GetSelectionScopeCommand(sublime_plugin.TextCommand):
@@ -666,7 +757,7 @@ class GetSelectionScopeCommand(sublime_plugin.TextCommand):
     def run(self, edit):
         """On demand scope request."""
 
-        sh_thread.modified = True
+        sh_thread.trigger(debounce=False)
 
     def is_enabled(self):
         """Check if we should scope this view."""
@@ -685,8 +776,7 @@ class ToggleSelectionScopeCommand(sublime_plugin.TextCommand):
         sh_thread.instant_scoper = False
         if not self.view.settings().get('scope_hunter.view_enable', False):
             self.view.settings().set('scope_hunter.view_enable', True)
-            sh_thread.modified = True
-            sh_thread.time = time()
+            sh_thread.trigger()
         else:
             self.view.settings().set('scope_hunter.view_enable', False)
             close_display = True
@@ -727,6 +817,10 @@ class SelectionScopeListener(sublime_plugin.EventListener):
         if sh_thread is None:
             return
 
+        index = token_indexes.get(view.id())
+        if index is not None and len(view.sel()):
+            index.selection = view.sel()[0].begin()
+
         enabled = sh_thread.is_enabled(view)
         view_enable = view.settings().get('scope_hunter.view_enable', False)
         if (not sh_thread.instant_scoper and not view_enable) or not enabled:
@@ -734,8 +828,43 @@ class SelectionScopeListener(sublime_plugin.EventListener):
             if enabled:
                 self.clear_regions(view)
         else:
-            sh_thread.modified = True
-            sh_thread.time = time()
+            sh_thread.trigger()
+
+    def on_modified(self, view):
+        """Invalidate the view's token index from the modified point on."""
+
+        index = token_indexes.get(view.id())
+        if index is None:
+            return
+
+        if index.command in SELECTION_EDITS and index.selection is not None and len(view.sel()):
+            # The edit was at the selection before or after the edit.
+            # Include the end of the line before, as a newline may have been inserted or removed.
+            index.invalidate(max(0, min(index.selection, view.sel()[0].begin()) - 1))
+        else:
+            index.clear()
+        if len(view.sel()):
+            index.selection = view.sel()[0].begin()
+
+    def on_text_command(self, view, command_name, args):
+        """Remember the text command running in the view, to know how it modifies the view."""
+
+        index = token_indexes.get(view.id())
+        if index is not None:
+            index.command = command_name
+
+    def on_post_text_command(self, view, command_name, args):
+        """Forget the text command once it ran."""
+
+        index = token_indexes.get(view.id())
+        if index is not None:
+            index.command = None
+
+    def on_close(self, view):
+        """Drop the view's token index and popup."""
+
+        token_indexes.pop(view.id(), None)
+        popups.pop(view.id(), None)
 
     def on_activated(self, view):
         """Check color scheme on activated and update if needed."""
@@ -744,14 +873,26 @@ class SelectionScopeListener(sublime_plugin.EventListener):
             return
 
         if not view.settings().get('is_widget', False):
-            scheme = view.settings().get("color_scheme")
-            if scheme is None:
-                pref_settings = sublime.load_settings('Preferences.sublime-settings')
-                scheme = pref_settings.get('color_scheme')
+            scheme = view_color_scheme(view)
+            if scheme is not None and scheme not in scheme_matchers and not matcher_failed(scheme):
+                threading.Thread(target=init_color_scheme, args=(scheme,)).start()
+
+    def on_post_save(self, view):
+        """Update the color schemes if an override scheme was saved, or the popup template if it was saved."""
+
+        if sh_thread is None:
+            return
 
-            if scheme_matcher is not None and scheme is not None:
-                if scheme != scheme_matcher.scheme_file:
-                    threading.Thread(target=reinit_plugin).start()
+        file_name = view.file_name()
+        if TOOLTIP_SUPPORT and file_name is not None and file_name in (
+            os.path.join(sublime.packages_path(), 'ScopeHunter', 'popup.j2'),
+            os.path.join(sublime.packages_path(), 'ScopeHunter', 'popup_html.j2')
+        ):
+            for template in popup_templates.values():
+                template.clear()
+        elif file_name and file_name.endswith(('.sublime-color-scheme', '.hidden-color-scheme')):
+            override = 'Packages/' + os.path.relpath(file_name, sublime.packages_path()).replace('\\', '/')
+            threading.Thread(target=reinit_plugin, args=(override,)).start()
 
 
 class ShThread(threading.Thread):
@@ -759,90 +900,356 @@ class ShThread(threading.Thread):
 
     def __init__(self):
         """Setup the thread."""
+        self.condition = threading.Condition()
         self.reset()
         threading.Thread.__init__(self)
 
     def reset(self):
         """Reset the thread variables."""
-        self.wait_time = 0.12
+        self.wait_time = DEFAULT_WAIT_TIME
+        self.costs = MovingPercentile(DEBOUNCE_SAMPLES)
+        self.generation = 0
+        self.last = None
         self.time = time()
         self.modified = False
         self.ignore_all = False
         self.instant_scoper = False
         self.abort = False
 
-    def payload(self):
-        """Code to run."""
-        # Ignore selection inside the routine
+    def trigger(self, debounce=True):
+        """
+        Let the thread know there was a modification.
+
+        The payload runs `wait_time` after the last modification.
+        If `debounce` is disabled, the time of the last modification is not updated.
+        Each modification starts a new generation, and payloads of older generations
+        are cancelled.
+        """
+        with self.condition:
+            self.generation += 1
+            self.modified = True
+            if debounce:
+                self.time = time()
+            self.condition.notify()
+
+    def is_stale(self, generation):
+        """Check if a newer modification superseded the generation."""
+        return generation != self.generation
+
+    def payload(self, generation=None):
+        """
+        Code to run.
+
+        The selections' scopes are read here, on the UI thread, then their colors and styles
+        are matched and the output rendered on a worker thread, and the output is shown back
+        on the UI thread.  Each step stops if a newer modification superseded this payload.
+        The last output shown is passed along, so it can be reused if nothing shown changed.
+        """
+        if generation is None:
+            generation = self.generation
+        elif self.is_stale(generation):
+            # A newer modification is pending, so this queued payload is already stale.
+            return
         self.modified = False
-        self.ignore_all = True
         window = sublime.active_window()
         view = None if window is None else window.active_view()
         if view is not None:
-            get_selection_scopes.run(view)
-        self.ignore_all = False
-        self.time = time()
+            start = time()
+            scoper = GetSelectionScope()
+            if scoper.read(view, lambda: self.is_stale(generation), self.last):
+                sublime.set_timeout_async(lambda: self.process(scoper, start), 0)
+
+    def process(self, scoper, start):
+        """Match and render the output off the UI thread, then show it on the UI thread."""
+        if scoper.render():
+            sublime.set_timeout(lambda: self.display(scoper, start), 0)
+
+    def display(self, scoper, start):
+        """Show the rendered output."""
+        # Ignore selection inside the routine
+        self.ignore_all = True
+        try:
+            if scoper.show():
+                self.last = scoper
+                self.adapt_wait_time(time() - start)
+        finally:
+            with self.condition:
+                self.ignore_all = False
+                self.time = time()
+                self.condition.notify()
+
+    def adapt_wait_time(self, cost):
+        """
+        Adapt the delay after the last modification to the cost of recent payloads.
+
+        The delay is a multiple of a percentile of the recent costs, within the
+        configured bounds, so it is short when payloads are cheap and grows
+        when they are expensive.
+        """
+        self.costs.add(cost)
+        if bool(sh_settings.get('adaptive_debounce', True)):
+            percentile = float(sh_settings.get('debounce_cost_percentile', 90))
+            wait_time = self.costs.percentile(percentile) * float(sh_settings.get('debounce_cost_factor', 2.0))
+            wait_time = max(wait_time, float(sh_settings.get('debounce_min_wait', 0.05)))
+            self.wait_time = min(wait_time, float(sh_settings.get('debounce_max_wait', 1.0)))
+            debug(
+                "Payload took %.3fs, %d%% of the last %d payloads took at most %.3fs, delay is now %.3fs" % (
+                    cost, percentile, len(self.costs), self.costs.percentile(percentile), self.wait_time
+                )
+            )
+        else:
+            self.wait_time = DEFAULT_WAIT_TIME
 
     def is_enabled(self, view):
         """Check if we can execute."""
         return not view.settings().get("is_widget") and not self.ignore_all
 
-    def kill(self):
-        """Kill thread."""
-        self.abort = True
-        while self.is_alive():
-            pass
-        self.reset()
+    def kill(self, timeout=2.0):
+        """Kill thread, waiting at most `timeout` seconds for it to stop."""
+        with self.condition:
+            self.abort = True
+            self.condition.notify()
+        if self.is_alive():
+            self.join(timeout)
+        if not self.is_alive():
+            self.reset()
 
     def run(self):
-        """Thread loop."""
-        while not self.abort:
-            if not self.ignore_all:
-                if (
-                    self.modified is True and
-                    time() - self.time > self.wait_time
-                ):
-                    sublime.set_timeout(self.payload, 0)
-            sleep(0.5)
+        """Thread loop: sleep until a modification, then until `wait_time` after the last one."""
+        with self.condition:
+            while not self.abort:
+                if self.ignore_all or not self.modified:
+                    self.condition.wait()
+                    continue
+                remaining = self.time + self.wait_time - time()
+                if remaining > 0:
+                    self.condition.wait(remaining)
+                    continue
+                self.modified = False
+                sublime.set_timeout(lambda generation=self.generation: self.payload(generation), 0)
 
 
-def init_color_scheme():
-    """Setup color scheme match object with current scheme."""
+def get_popup_tail(view, tail):
+    """Get the popup tail converted to HTML, converting it only the first time."""
 
-    if _lock.locked():
-        return
+    html = popup_tails.get(tail)
+    if html is None:
+        html = popup_tails[tail] = mdpopups.md2html(view, tail)
+    return html
 
-    _lock.acquire()
 
-    global scheme_matcher
-    scheme_file = None
+def popup_hidden(view_id, popup):
+    """Forget the view's popup once it is hidden, unless a new popup was shown since."""
 
-    # Attempt syntax specific from view
-    window = sublime.active_window()
-    if window is not None:
-        view = window.active_view()
-        if view is not None:
-            scheme_file = view.settings().get('color_scheme', None)
+    if popups.get(view_id) is popup:
+        del popups[view_id]
+
+
+def get_token_index(view):
+    """Get the view's token index, up to date with the view's changes."""
+
+    index = token_indexes.get(view.id())
+    if index is None:
+        index = token_indexes[view.id()] = TokenIndex(view)
+    else:
+        index.sync()
+    return index
+
+
+def view_color_scheme(view):
+    """Get the view's color scheme, or the global color scheme if the view doesn't set one."""
 
-    # Get global scheme
+    scheme_file = None
+    if view is not None:
+        scheme_file = view.settings().get('color_scheme', None)
     if scheme_file is None:
         pref_settings = sublime.load_settings('Preferences.sublime-settings')
         scheme_file = pref_settings.get('color_scheme')
+    return scheme_file
 
-    try:
-        scheme_matcher = ColorSchemeMatcher(scheme_file)
-    except Exception:
-        scheme_matcher = None
-        log("Theme parsing failed!  Ignoring theme related info.")
-        debug(str(traceback.format_exc()))
-    finally:
-        _lock.release()
 
+def get_matcher_options():
+    """Get the color scheme matcher settings."""
 
-def reinit_plugin():
-    """Reload scheme object and tooltip theme."""
+    if bool(sh_settings.get('scheme_cache', True)):
+        cache_dir = os.path.join(sublime.cache_path(), 'ScopeHunter')
+    else:
+        cache_dir = None
+
+    return {
+        "native_scoring": bool(sh_settings.get('native_selector_scoring', False)),
+        "cache_size": int(sh_settings.get('matcher_cache_size', 5000)),
+        "cache_dir": cache_dir,
+        "persist_results": bool(sh_settings.get('persistent_result_cache', False))
+    }
+
+
+def active_color_scheme():
+    """Get the active view's color scheme."""
+
+    window = sublime.active_window()
+    return view_color_scheme(window.active_view() if window is not None else None)
+
+
+def get_scheme_matcher(view):
+    """
+    Get the color scheme matcher for the view's color scheme.
+
+    If the scheme isn't in the pool, the matcher is set up, or if it is already
+    being set up, it is waited for.  If the pooled matcher was created with
+    different settings, it keeps being used while a new one is set up.  If
+    setting up the matcher failed with the current settings, it isn't tried
+    again until the schemes are reloaded.
+    """
+
+    return get_scheme_matcher_for(view_color_scheme(view))
+
+
+def get_scheme_matcher_for(scheme_file):
+    """Get the color scheme matcher for the color scheme (see `get_scheme_matcher`)."""
+
+    if scheme_file is None:
+        return None
+    entry = scheme_matchers.get(scheme_file)
+    if entry is None:
+        return None if matcher_failed(scheme_file) else init_color_scheme(scheme_file)
+    if entry[1] != get_matcher_options() and not matcher_failed(scheme_file):
+        threading.Thread(target=init_color_scheme, args=(scheme_file,)).start()
+    return entry[0]
+
+
+def matcher_failed(scheme_file):
+    """Check if setting up the scheme's matcher failed with the current settings."""
+
+    return scheme_failures.get(scheme_file) == get_matcher_options()
 
-    init_color_scheme()
+
+class MatcherBuild(object):
+    """
+    A color scheme matcher being set up.
+
+    Requests for the same scheme that are made while it is being set up are
+    merged into one more run of the build, so the latest changes are seen.
+    Requesters can wait for the build to be done.
+    """
+
+    def __init__(self, override):
+        """Initialize."""
+
+        self.override = override
+        self.pending = True
+        self.matcher = None
+        self.done = threading.Event()
+
+    def request(self, override):
+        """Request the build to run again for the override, or for all overrides if `None`."""
+
+        if self.pending and self.override != override:
+            self.override = None
+        else:
+            self.override = override
+        self.pending = True
+
+
+def build_matcher(scheme_file, override):
+    """
+    Setup color scheme match object for the scheme.
+
+    If the pooled matcher was created with the current settings, an updated copy
+    is made with any override changes, otherwise a new matcher is created.  The
+    pooled matcher is not modified.  Return the matcher and its settings.
+    """
+
+    options = get_matcher_options()
+    entry = scheme_matchers.peek(scheme_file)
+    if entry is not None and entry[1] == options:
+        matcher = entry[0]
+        try:
+            updated = matcher.update_overrides(override if override in matcher.overrides else None)
+            if updated is not None:
+                return updated, options
+        except Exception:
+            debug(str(traceback.format_exc()))
+    return ColorSchemeMatcher(scheme_file, **options), options
+
+
+def init_color_scheme(scheme_file=None, override=None):
+    """
+    Setup color scheme match object for the scheme and add it to the pool.
+
+    If no scheme is given, the active view's scheme is used.  If `override` is
+    given, only that override is checked for changes.  While the new matcher is
+    set up, the pooled one keeps being used, and it is swapped in when ready.
+    If the scheme's matcher is already being set up, the request is merged into
+    that build and waits for it.  If setting up fails, the pooled matcher is kept,
+    and the failure is remembered until the schemes are reloaded.
+    The least recently used matchers are dropped when the pool is full.
+    """
+
+    if scheme_file is None:
+        scheme_file = active_color_scheme()
+    if scheme_file is None:
+        return None
+
+    with _lock:
+        build = scheme_builds.get(scheme_file)
+        waiting = build is not None
+        if waiting:
+            build.request(override)
+        else:
+            build = scheme_builds[scheme_file] = MatcherBuild(override)
+    if waiting:
+        build.done.wait()
+        return build.matcher
+
+    while True:
+        with _lock:
+            if not build.pending:
+                del scheme_builds[scheme_file]
+                entry = scheme_matchers.peek(scheme_file)
+                build.matcher = entry[0] if entry is not None else None
+                break
+            override = build.override
+            build.pending = False
+
+        try:
+            matcher, options = build_matcher(scheme_file, override)
+        except Exception:
+            log("Theme parsing failed!  Ignoring theme related info.")
+            debug(str(traceback.format_exc()))
+            with _lock:
+                scheme_failures[scheme_file] = get_matcher_options()
+            continue
+
+        with _lock:
+            scheme_failures.pop(scheme_file, None)
+            old = scheme_matchers.peek(scheme_file)
+            scheme_matchers.resize(int(sh_settings.get('matcher_pool_size', 4)))
+            scheme_matchers.set(scheme_file, (matcher, options))
+        if old is not None and old[0] is not matcher:
+            old[0].save_results()
+
+    build.done.set()
+    return build.matcher
+
+
+def reinit_plugin(override=None):
+    """Reload scheme objects and tooltip theme."""
+
+    with _lock:
+        scheme_failures.clear()
+    schemes = scheme_matchers.keys()
+    scheme_file = active_color_scheme()
+    if scheme_file is not None and scheme_file not in schemes:
+        schemes.append(scheme_file)
+    for scheme_file in schemes:
+        init_color_scheme(scheme_file, override)
+
+
+def reinit_plugin_async():
+    """Reload scheme objects in the background while the current ones keep being used."""
+
+    threading.Thread(target=reinit_plugin).start()
 
 
 def init_plugin():
@@ -861,7 +1268,7 @@ def init_plugin():
     init_color_scheme()
 
     pref_settings.clear_on_change('scopehunter_reload')
-    pref_settings.add_on_change('scopehunter_reload', reinit_plugin)
+    pref_settings.add_on_change('scopehunter_reload', reinit_plugin_async)
 
     sh_settings.clear_on_change('reload')
 
@@ -885,4 +1292,7 @@ def plugin_unloaded():
     pref_settings = sublime.load_settings('Preferences.sublime-settings')
     pref_settings.clear_on_change('scopehunter_reload')
 
+    for scheme_file in scheme_matchers.keys():
+        scheme_matchers.pop(scheme_file)[0].save_results()
+
     sh_thread.kill()
@@ -0,0 +1,136 @@
+"""Fake view."""
+import bisect
+from collections import Counter
+from lib.scope_selector import score_selector
+
+
+class Region(object):
+    """Stand in for `sublime.Region`."""
+
+    def __init__(self, a, b=None):
+        """Initialize."""
+
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        """Get the start of the region."""
+
+        return min(self.a, self.b)
+
+    def end(self):
+        """Get the end of the region."""
+
+        return max(self.a, self.b)
+
+    def size(self):
+        """Get the size of the region."""
+
+        return self.end() - self.begin()
+
+    def contains(self, pt):
+        """Check if the point is in the region."""
+
+        return self.begin() <= pt <= self.end()
+
+
+def char_tokens(text, scopes):
+    """Get the tokens of text with one scope per character."""
+
+    return list(zip(text, scopes))
+
+
+class View(object):
+    """
+    Stand in for a Sublime view, made of `(text, scope)` tokens.
+
+    The calls made to the view's API are counted by name in `calls`.
+    """
+
+    def __init__(self, tokens):
+        """Initialize."""
+
+        self.calls = Counter()
+        self.syntax = 'Packages/Test/Test.sublime-syntax'
+        self.count = 0
+        self.matched = {}
+        self.edit(tokens)
+
+    def edit(self, tokens):
+        """Replace the text and scopes."""
+
+        self.starts = []
+        self.scopes = []
+        parts = []
+        pt = 0
+        for text, scope in tokens:
+            if text:
+                self.starts.append(pt)
+                self.scopes.append(scope)
+                parts.append(text)
+                pt += len(text)
+        self.text = ''.join(parts)
+        self.count += 1
+
+    def token_at(self, pt):
+        """Get the index of the token containing the character at the point, or the last token past the end."""
+
+        return bisect.bisect_right(self.starts, min(pt, len(self.text) - 1)) - 1
+
+    def matches(self, index, selector):
+        """Check if the selector matches the token."""
+
+        key = (self.scopes[index], selector)
+        match = self.matched.get(key)
+        if match is None:
+            match = self.matched[key] = score_selector(self.scopes[index], selector) > 0
+        return match
+
+    def settings(self):
+        """Get the view's settings."""
+
+        return {'syntax': self.syntax}
+
+    def change_count(self):
+        """Get the change count."""
+
+        return self.count
+
+    def size(self):
+        """Get the size of the buffer."""
+
+        return len(self.text)
+
+    def line(self, pt):
+        """Get the line containing the point, without its newline."""
+
+        self.calls['line'] += 1
+        begin = self.text.rfind('\n', 0, pt) + 1
+        end = self.text.find('\n', pt)
+        return Region(begin, len(self.text) if end == -1 else end)
+
+    def scope_name(self, pt):
+        """Get the scope at the point."""
+
+        self.calls['scope_name'] += 1
+        return self.scopes[self.token_at(pt)]
+
+    def match_selector(self, pt, selector):
+        """Check if the selector matches the scope at the point."""
+
+        self.calls['match_selector'] += 1
+        return self.matches(self.token_at(pt), selector)
+
+    def find_by_selector(self, selector):
+        """Get the regions of the tokens that match the selector, merging adjacent regions."""
+
+        self.calls['find_by_selector'] += 1
+        regions = []
+        for index, start in enumerate(self.starts):
+            if self.matches(index, selector):
+                end = self.starts[index + 1] if index + 1 < len(self.starts) else len(self.text)
+                if regions and regions[-1].b == start:
+                    regions[-1].b = end
+                else:
+                    regions.append(Region(start, end))
+        return regions
@@ -0,0 +1,56 @@
+"""Test LRU cache."""
+import unittest
+from lib.lru_cache import LRUCache
+
+
+class TestLRUCache(unittest.TestCase):
+    """Test LRU cache."""
+
+    def test_eviction(self):
+        """Test that the least recently used entry is evicted."""
+
+        cache = LRUCache(2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+        self.assertEqual(cache.keys(), ['a', 'c'])
+
+    def test_stats(self):
+        """Test hit, miss, and eviction counts."""
+
+        cache = LRUCache(1)
+        cache.set('a', 1)
+        cache.get('a')
+        cache.get('b')
+        cache.set('b', 2)
+        self.assertEqual(
+            cache.stats(),
+            {"size": 1, "maxsize": 1, "hits": 1, "misses": 1, "evictions": 1}
+        )
+
+    def test_resize(self):
+        """Test that shrinking the cache evicts the oldest entries."""
+
+        cache = LRUCache(3)
+        for key in ('a', 'b', 'c'):
+            cache.set(key, key)
+        cache.resize(1)
+        self.assertEqual(cache.keys(), ['c'])
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_on_evict(self):
+        """Test that evicted entries are passed to the eviction callback."""
+
+        evicted = []
+        cache = LRUCache(2, on_evict=lambda key, value: evicted.append((key, value)))
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.set('c', 3)
+        self.assertEqual(evicted, [('a', 1)])
+        cache.resize(1)
+        self.assertEqual(evicted, [('a', 1), ('b', 2)])
+        self.assertEqual(cache.items(), [('c', 3)])
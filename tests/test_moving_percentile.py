@@ -0,0 +1,28 @@
+"""Test moving percentile."""
+import unittest
+from lib.moving_percentile import MovingPercentile
+
+
+class TestMovingPercentile(unittest.TestCase):
+    """Test moving percentile."""
+
+    def test_percentile(self):
+        """Test nearest rank percentiles."""
+
+        costs = MovingPercentile(10)
+        self.assertIsNone(costs.percentile(90))
+        for value in (5, 1, 4, 2, 3):
+            costs.add(value)
+        self.assertEqual(costs.percentile(0), 1)
+        self.assertEqual(costs.percentile(50), 3)
+        self.assertEqual(costs.percentile(90), 5)
+        self.assertEqual(costs.percentile(100), 5)
+
+    def test_window(self):
+        """Test that only the most recent samples are kept."""
+
+        costs = MovingPercentile(3)
+        for value in (100, 1, 2, 3):
+            costs.add(value)
+        self.assertEqual(len(costs), 3)
+        self.assertEqual(costs.percentile(100), 3)
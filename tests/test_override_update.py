@@ -0,0 +1,243 @@
+"""Test incremental override updates."""
+import copy
+import json
+import sys
+import types
+import unittest
+from unittest import mock
+from lib.scope_selector import score_selector
+
+# Resources by name, standing in for Sublime's packages.
+resources = {}
+# The calls made to the stubbed `sublime.score_selector`.
+sublime_scores = []
+
+
+def find_resources(pattern):
+    """Find the resources with the file name."""
+
+    return sorted(name for name in resources if name.split('/')[-1] == pattern)
+
+
+def load_resource(name):
+    """Load a resource."""
+
+    if name not in resources:
+        raise IOError(name)
+    return resources[name]
+
+
+def sublime_score_selector(scope, selector):
+    """Score the selector like Sublime, recording the call."""
+
+    sublime_scores.append((scope, selector))
+    return score_selector(scope, selector)
+
+
+def make_sublime():
+    """Create a stand in for the `sublime` module, serving `resources`."""
+
+    sublime = types.ModuleType('sublime')
+    sublime.version = lambda: '4000'
+    sublime.platform = lambda: 'linux'
+    sublime.packages_path = lambda: '/nonexistent/Packages'
+    sublime.find_resources = find_resources
+    sublime.load_resource = load_resource
+    sublime.decode_value = json.loads
+    sublime.score_selector = sublime_score_selector
+    return sublime
+
+
+def stub_sublime():
+    """
+    Import the color scheme matcher with the `sublime` module stubbed.
+
+    Returns the matcher class, and the patch to stop once done with it, which
+    restores the modules, so the stub doesn't leak into other tests.
+    """
+
+    patch = mock.patch.dict(sys.modules, {'sublime': make_sublime()})
+    patch.start()
+    sys.modules.pop('lib.color_scheme_matcher', None)
+    from lib.color_scheme_matcher import ColorSchemeMatcher
+    return ColorSchemeMatcher, patch
+
+
+ColorSchemeMatcher = None
+sublime_patch = None
+
+
+def setUpModule():
+    """Stub the `sublime` module."""
+
+    global ColorSchemeMatcher
+    global sublime_patch
+    ColorSchemeMatcher, sublime_patch = stub_sublime()
+
+
+def tearDownModule():
+    """Restore the `sublime` module."""
+
+    sublime_patch.stop()
+
+
+SCHEME = 'Packages/Test/Test.sublime-color-scheme'
+USER = 'Packages/User/Test.sublime-color-scheme'
+
+BASE = {
+    "variables": {"red": "#ff0000", "blue": "#0000ff", "green": "#00ff00", "text": "#cccccc"},
+    "globals": {"foreground": "var(text)", "background": "#222222"},
+    "rules": [
+        {"name": "Comment", "scope": "comment", "foreground": "var(green)", "font_style": "italic"},
+        {"name": "String", "scope": "string", "foreground": "var(red)"},
+        {"name": "Keyword", "scope": "keyword", "foreground": "var(blue)", "font_style": "bold"},
+        {"name": "Function", "scope": "entity.name.function", "foreground": "#ffff00"},
+        {"name": "Escape", "scope": "constant.character.escape", "background": "var(red)"}
+    ]
+}
+
+OVERRIDE = {
+    "variables": {},
+    "rules": [
+        {"name": "User String", "scope": "string", "foreground": "#ff00ff"},
+        {"name": "Number", "scope": "constant.numeric", "foreground": "var(blue)"}
+    ]
+}
+
+SCOPES = (
+    'source.python',
+    'source.python comment.line.number-sign.python',
+    'source.python string.quoted.double.python',
+    'source.python string.quoted.double.python constant.character.escape.python',
+    'source.python keyword.control.flow.python',
+    'source.python entity.name.function.python',
+    'source.python constant.numeric.integer.python',
+    'source.python constant.language.python'
+)
+
+
+class TestOverrideUpdate(unittest.TestCase):
+    """Test that matchers updated incrementally match matchers created from scratch, scoring with Sublime."""
+
+    native_scoring = False
+
+    def setUp(self):
+        """Setup the scheme and its user override."""
+
+        del sublime_scores[:]
+        resources.clear()
+        resources[SCHEME] = json.dumps(BASE)
+        resources[USER] = json.dumps(OVERRIDE)
+        self.matcher = ColorSchemeMatcher(SCHEME, native_scoring=self.native_scoring)
+        self.before = [self.matcher.guess_color(scope) for scope in SCOPES]
+
+    def update(self, override=None, **schemes):
+        """Change the schemes, and update the matcher."""
+
+        for name, scheme in schemes.items():
+            resources[SCHEME if name == 'base' else USER] = json.dumps(scheme)
+        return self.matcher.update_overrides(override)
+
+    def assert_updated(self, updated):
+        """Check that the updated matcher matches a new one, and that the original matcher is unchanged."""
+
+        self.assertIsNotNone(updated)
+        self.assertIsNot(updated, self.matcher)
+        fresh = ColorSchemeMatcher(SCHEME, native_scoring=self.native_scoring)
+        for scope in SCOPES:
+            self.assertEqual(updated.guess_color(scope), fresh.guess_color(scope), scope)
+        self.assertEqual([self.matcher.guess_color(scope) for scope in SCOPES], self.before)
+        self.assertEqual(bool(sublime_scores), not self.native_scoring)
+
+    def test_unchanged(self):
+        """Test that the matcher is kept if nothing changed."""
+
+        self.assertIs(self.update(), self.matcher)
+
+    def test_insert_rule(self):
+        """Test a rule inserted in an override."""
+
+        scheme = copy.deepcopy(OVERRIDE)
+        scheme['rules'].insert(1, {"name": "Constant", "scope": "constant", "foreground": "#123456"})
+        self.assert_updated(self.update(USER, user=scheme))
+
+    def test_insert_unmatched_rule(self):
+        """Test a rule inserted before the others, shifting the ids of rules of cached scopes it doesn't match."""
+
+        scheme = copy.deepcopy(BASE)
+        scheme['rules'].insert(0, {"name": "Heading", "scope": "markup.heading", "font_style": "bold"})
+        self.assert_updated(self.update(base=scheme))
+
+    def test_delete_rule(self):
+        """Test a rule deleted from an override."""
+
+        scheme = copy.deepcopy(OVERRIDE)
+        del scheme['rules'][1]
+        self.assert_updated(self.update(USER, user=scheme))
+
+    def test_edit_rule(self):
+        """Test a rule edited in an override."""
+
+        scheme = copy.deepcopy(OVERRIDE)
+        scheme['rules'][1]['foreground'] = '#654321'
+        scheme['rules'][1]['font_style'] = 'bold'
+        self.assert_updated(self.update(USER, user=scheme))
+
+    def test_edit_base_rule(self):
+        """Test a rule edited in the scheme itself."""
+
+        scheme = copy.deepcopy(BASE)
+        scheme['rules'][3]['foreground'] = '#00ffff'
+        self.assert_updated(self.update(base=scheme))
+
+    def test_changed_variable(self):
+        """Test a variable changed by an override, used by rules of both schemes."""
+
+        scheme = copy.deepcopy(OVERRIDE)
+        scheme['variables']['blue'] = '#0000aa'
+        self.assert_updated(self.update(USER, user=scheme))
+
+    def test_changed_variable_in_global(self):
+        """Test that a changed variable used by a global option needs a new matcher."""
+
+        scheme = copy.deepcopy(OVERRIDE)
+        scheme['variables']['text'] = '#dddddd'
+        self.assertIsNone(self.update(USER, user=scheme))
+
+    def test_changed_global(self):
+        """Test that a changed global option needs a new matcher."""
+
+        scheme = copy.deepcopy(OVERRIDE)
+        scheme['globals'] = {'background': '#000000'}
+        self.assertIsNone(self.update(USER, user=scheme))
+
+    def test_scope_in_two_schemes(self):
+        """Test edits to a scope defined by both the scheme and the override."""
+
+        scheme = copy.deepcopy(OVERRIDE)
+        scheme['rules'][0]['foreground'] = '#00ffff'
+        self.assert_updated(self.update(USER, user=scheme))
+
+        self.setUp()
+        scheme = copy.deepcopy(OVERRIDE)
+        del scheme['rules'][0]
+        self.assert_updated(self.update(USER, user=scheme))
+
+        self.setUp()
+        scheme = copy.deepcopy(BASE)
+        scheme['rules'][1]['foreground'] = '#00ffff'
+        scheme['rules'][1]['font_style'] = 'italic'
+        self.assert_updated(self.update(base=scheme))
+
+    def test_removed_override(self):
+        """Test that a removed override needs a new matcher."""
+
+        del resources[USER]
+        self.assertIsNone(self.matcher.update_overrides())
+        self.assertIsNone(self.matcher.update_overrides(USER))
+
+
+class TestOverrideUpdateNative(TestOverrideUpdate):
+    """Test incremental override updates with native selector scoring."""
+
+    native_scoring = True
@@ -0,0 +1,101 @@
+"""Test persistent result cache."""
+import unittest
+import tempfile
+import shutil
+import os
+from lib.result_cache import ResultStore
+
+
+class TestResultStore(unittest.TestCase):
+    """Test persistent result store."""
+
+    def setUp(self):
+        """Setup temporary folder."""
+
+        self.folder = tempfile.mkdtemp()
+        self.filename = os.path.join(self.folder, 'cache', 'results.jsonl')
+
+    def tearDown(self):
+        """Remove temporary folder."""
+
+        shutil.rmtree(self.folder)
+
+    def test_round_trip(self):
+        """Test that results are read back in a new session."""
+
+        store = ResultStore(self.filename, 'key', flush_size=2)
+        store.add('source.python', {'color': '#FFFFFF'})
+        store.add('source.js', {'color': '#000000'})
+        store.add('text.plain', {'color': '#333333'})
+        store.flush()
+
+        store = ResultStore(self.filename, 'key')
+        self.assertEqual(store.get('source.python'), {'color': '#FFFFFF'})
+        self.assertEqual(store.get('text.plain'), {'color': '#333333'})
+
+    def test_key_change(self):
+        """Test that results for a different key are discarded."""
+
+        store = ResultStore(self.filename, 'old')
+        store.add('source.python', {'color': '#FFFFFF'})
+        store.flush()
+
+        store = ResultStore(self.filename, 'new')
+        self.assertIsNone(store.get('source.python'))
+        store.add('source.js', {'color': '#000000'})
+        store.flush()
+
+        store = ResultStore(self.filename, 'new')
+        self.assertIsNone(store.get('source.python'))
+        self.assertEqual(store.get('source.js'), {'color': '#000000'})
+
+    def test_partial_line(self):
+        """Test that a partially written line is skipped."""
+
+        store = ResultStore(self.filename, 'key')
+        store.add('source.python', {'color': '#FFFFFF'})
+        store.flush()
+        with open(self.filename, 'a') as f:
+            f.write('["source.js", {"col')
+
+        store = ResultStore(self.filename, 'key')
+        self.assertEqual(store.get('source.python'), {'color': '#FFFFFF'})
+        self.assertIsNone(store.get('source.js'))
+
+    def test_late_flush_from_old_store(self):
+        """Test that an old store's late flush doesn't append to a newer store's file."""
+
+        old = ResultStore(self.filename, 'old')
+        old.add('source.python', {'color': '#FFFFFF'})
+        old.flush()
+        old.add('source.js', {'color': '#FFFFFF'})
+
+        new = ResultStore(self.filename, 'new')
+        new.created = old.created + 1
+        new.add('source.python', {'color': '#000000'})
+        new.flush()
+        old.flush()
+        new.add('text.plain', {'color': '#333333'})
+        new.flush()
+
+        store = ResultStore(self.filename, 'new')
+        self.assertEqual(store.get('source.python'), {'color': '#000000'})
+        self.assertEqual(store.get('text.plain'), {'color': '#333333'})
+        self.assertIsNone(store.get('source.js'))
+        self.assertIsNone(ResultStore(self.filename, 'old').get('source.python'))
+
+    def test_append_after_partial_line(self):
+        """Test that results appended after a partially written line are kept."""
+
+        store = ResultStore(self.filename, 'key')
+        store.add('source.python', {'color': '#FFFFFF'})
+        store.flush()
+        with open(self.filename, 'a') as f:
+            f.write('["source.js", {"col')
+        store.add('text.plain', {'color': '#333333'})
+        store.flush()
+
+        store = ResultStore(self.filename, 'key')
+        self.assertEqual(store.get('source.python'), {'color': '#FFFFFF'})
+        self.assertEqual(store.get('text.plain'), {'color': '#333333'})
+        self.assertIsNone(store.get('source.js'))
@@ -0,0 +1,40 @@
+"""Test color scheme records."""
+import unittest
+from lib.scheme_records import SchemeRule, ScopeMatch, StyleTable
+
+
+class TestSchemeRecords(unittest.TestCase):
+    """Test color scheme records."""
+
+    def test_rule_round_trip(self):
+        """Test that a processed rule survives a dump and load."""
+
+        rule = SchemeRule(3, 'String', 'string', '#ff0000', ['#ff0000', '#00ff00'], None, None, ['bold'])
+        rule.color_gradient = [('#ff0000', '#FF0000'), ('#00ff00', '#00FF00')]
+        rule.processed = True
+        loaded = SchemeRule.load([list(v) if isinstance(v, list) else v for v in rule.dump()])
+        for field in SchemeRule.FIELDS:
+            self.assertEqual(getattr(loaded, field), getattr(rule, field), field)
+        self.assertIsNone(loaded.selector)
+
+    def test_match_round_trip(self):
+        """Test that a match survives a dump and load."""
+
+        match = ScopeMatch(1, -1, 2, -1, 1, -1, 3)
+        self.assertEqual(ScopeMatch.load(match.dump()).dump(), [1, -1, 2, -1, 1, -1, 3])
+
+    def test_style_table(self):
+        """Test that styles are interned."""
+
+        styles = StyleTable()
+        self.assertEqual(styles.intern(''), 0)
+        bold = styles.intern('bold')
+        self.assertEqual(styles.intern('bold'), bold)
+        self.assertEqual(styles.name(bold), 'bold')
+
+    def test_match_remap(self):
+        """Test that rule ids are remapped and missing rules are left alone."""
+
+        match = ScopeMatch(1, -1, 2, -1, 1, 4, 3)
+        match.remap({1: 0, 2: 5, 4: 4})
+        self.assertEqual(match.dump(), [0, -1, 5, -1, 0, 4, 3])
@@ -0,0 +1,53 @@
+"""Test scope extent."""
+import unittest
+from lib.scope_extent import find_extent
+from .fake_view import View, char_tokens
+
+
+def search_file(view, pt, selector):
+    """Find the extent by checking every character in the file."""
+
+    regions = []
+    for index in range(view.size()):
+        if view.match_selector(index, selector):
+            if regions and regions[-1][1] == index:
+                regions[-1][1] = index + 1
+            else:
+                regions.append([index, index + 1])
+    for begin, end in regions:
+        if begin <= pt <= end:
+            return begin, end
+    return pt, pt
+
+
+class TestScopeExtent(unittest.TestCase):
+    """Test scope extent."""
+
+    scopes = (
+        ['source'] * 3 +
+        ['source string'] * 2 +
+        ['source string constant'] +
+        ['source string'] * 2 +
+        ['source comment'] * 3 +
+        ['source'] * 2
+    )
+
+    def test_matches_file_search(self):
+        """Test that the local extent is the same as searching the whole file."""
+
+        view = View(char_tokens('x' * len(self.scopes), self.scopes))
+        for pt in range(view.size() + 1):
+            for selector in set(self.scopes):
+                self.assertEqual(
+                    find_extent(view, pt, selector, 100),
+                    search_file(view, pt, selector),
+                    'point %d, selector %r' % (pt, selector)
+                )
+
+    def test_window(self):
+        """Test that extents reaching the window need a whole file search."""
+
+        view = View(char_tokens('x' * len(self.scopes), self.scopes))
+        self.assertEqual(find_extent(view, 4, 'source string', 4), (3, 8))
+        self.assertIsNone(find_extent(view, 4, 'source string', 1))
+        self.assertIsNone(find_extent(view, 4, 'source', 4))
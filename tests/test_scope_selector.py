@@ -0,0 +1,149 @@
+"""Test scope selector helpers."""
+import unittest
+from lib import scope_selector
+
+
+class TestSelectorAtoms(unittest.TestCase):
+    """Test selector atom extraction."""
+
+    def test_tokenize(self):
+        """Test that exclusions are split from atoms, but hyphens inside atoms are not."""
+
+        self.assertEqual(
+            scope_selector.tokenize('meta.tag-name -string, (a|b)&c'),
+            ['meta.tag-name', '-', 'string', ',', '(', 'a', '|', 'b', ')', '&', 'c']
+        )
+
+    def test_prefixes(self):
+        """Test dotted prefixes of a scope element."""
+
+        self.assertEqual(
+            scope_selector.atom_prefixes('string.quoted.double'),
+            ['string', 'string.quoted', 'string.quoted.double']
+        )
+
+    def test_bound(self):
+        """Test selectors whose alternatives all require a positive atom."""
+
+        for selector in ('string', 'source string - comment', 'a, b', '(a | b) - c', 'a & b'):
+            atoms, unbound = scope_selector.selector_atoms(selector)
+            self.assertFalse(unbound, selector)
+
+    def test_unbound(self):
+        """Test selectors with an alternative that has no positive atom."""
+
+        for selector in ('', '- comment', 'a, - b', '(a, - b) - d', '- (a)'):
+            atoms, unbound = scope_selector.selector_atoms(selector)
+            self.assertTrue(unbound, selector)
+
+
+class TestSelectorIndex(unittest.TestCase):
+    """Test the selector index."""
+
+    def setUp(self):
+        """Setup the index."""
+
+        self.index = scope_selector.SelectorIndex()
+        for rule_id, selector in enumerate(
+            ['comment', 'string', 'string.quoted.single', 'keyword.control', 'source.python - string', '- comment']
+        ):
+            self.index.add(rule_id, selector)
+
+    def test_candidates(self):
+        """Test that only rules that reference the scope's atoms are returned in rule order."""
+
+        self.assertEqual(
+            self.index.candidates('source.python string.quoted.double.python'),
+            [1, 4, 5]
+        )
+        self.assertEqual(
+            self.index.candidates('source.js keyword.control.flow.js'),
+            [3, 5]
+        )
+
+    def test_no_partial_atoms(self):
+        """Test that atoms only match on dotted boundaries."""
+
+        self.assertEqual(self.index.candidates('strings.foo'), [5])
+
+
+# Scores expected from the native engine's scoring model, worked out by hand, not recorded from Sublime Text.
+# Each matched atom scores its number of dotted parts, shifted left by 3 bits per element of depth,
+# and a path scores the sum of its atoms.  `&` scores the best of its sides if both match, and `-`
+# scores its left side unless its right side matches.  A negation on its own scores 1 if its selector
+# doesn't match.
+MODEL_SCORES = [
+    ('source.python', 'source', 1),
+    ('source.python', 'source.python', 2),
+    ('source.python', 'source.js', 0),
+    ('source.python', 'sour', 0),
+    ('source.python meta.function.python', 'meta', 8),
+    ('source.python meta.function.python', 'meta.function', 16),
+    ('source.python meta.function.python', 'source meta.function', 17),
+    ('source.python meta.function.python', 'meta.function source', 0),
+    ('source.python meta.function.python entity.name.function.python', 'entity.name', 128),
+    ('source.python meta.function.python entity.name.function.python', 'meta entity', 72),
+    ('source.python string.quoted.double.python', 'string - comment', 8),
+    ('source.python comment.line.python string.quoted', 'string - comment', 0),
+    ('source.python string.quoted.double.python', 'comment, string.quoted', 16),
+    ('source.python string.quoted.double.python', 'comment | string.quoted', 16),
+    ('source.python string.quoted.double.python', 'source & string', 8),
+    ('source.python string.quoted.double.python', 'source & comment', 0),
+    ('source.python string.quoted.double.python', '(comment, string) - source.js', 8),
+    ('source.python string.quoted.double.python', '(comment, string) - source.python', 0),
+    ('source.python string.quoted.double.python', 'source - (comment, string)', 0),
+    ('source.python string.quoted.double.python', 'source - string.unquoted', 1),
+    ('text.html.basic meta.tag-name.html', 'meta.tag-name', 16),
+    ('text.html.basic meta.tag-name.html', 'meta.tag', 0),
+    ('source.python', '', 0),
+    ('source.python meta.function.python string.quoted.double.python', '- comment', 1),
+    ('source.python meta.function.python string.quoted.double.python', '- string', 0),
+    ('source.python meta.function.python string.quoted.double.python', 'meta - string', 0),
+    ('source.python meta.function.python string.quoted.double.python', 'string - meta.function.parameters', 64),
+    ('source.python meta.function.python string.quoted.double.python', 'string.quoted - meta.function string', 0),
+    ('source.python meta.function.python string.quoted.double.python', 'string.quoted - string meta.function', 128),
+    ('source.python meta.function.python string.quoted.double.python', 'source - meta - string', 0),
+    ('source.python meta.function.python string.quoted.double.python', 'meta & string.quoted', 128),
+    ('source.python meta.function.python string.quoted.double.python', 'source & - string', 0),
+    ('source.python meta.function.python string.quoted.double.python', 'source & - comment', 1),
+    ('source.python meta.function.python string.quoted.double.python', '(meta - string) & source', 0),
+    ('source.python meta.function.python string.quoted.double.python', '(source & string) - (meta & comment)', 64),
+    ('source.python meta.function.python string.quoted.double.python', 'meta - (string, comment)', 0),
+    ('source.python meta.function.python string.quoted.double.python', 'meta - (comment, keyword)', 8),
+    ('source.python meta.function.python string.quoted.double.python', '-(meta string)', 0),
+    ('source.python meta.function.python string.quoted.double.python', '-(meta comment)', 1),
+]
+
+
+class TestScopeSelector(unittest.TestCase):
+    """Test the native selector engine's scoring model."""
+
+    def test_scores(self):
+        """Test that scores match the scoring model."""
+
+        for scope, selector, expected in MODEL_SCORES:
+            self.assertEqual(
+                scope_selector.score_selector(scope, selector), expected,
+                "score_selector(%r, %r)" % (scope, selector)
+            )
+
+    def test_compiled_reuse(self):
+        """Test that a compiled selector can score many scopes."""
+
+        selector = scope_selector.ScopeSelector('string - comment, keyword.control')
+        self.assertEqual(selector.score('source.python keyword.control.flow.python'), 16)
+        self.assertEqual(selector.score(['source.python', 'string.quoted.python']), 8)
+        self.assertEqual(selector.score('source.python comment.line string.quoted'), 0)
+
+    def test_ranking(self):
+        """Test that deeper and more specific selectors win."""
+
+        scope = 'source.python meta.function.python entity.name.function.python'
+        ranked = sorted(
+            ['source', 'source.python', 'meta', 'meta.function', 'entity', 'entity.name.function'],
+            key=lambda s: scope_selector.score_selector(scope, s)
+        )
+        self.assertEqual(
+            ranked,
+            ['source', 'source.python', 'meta', 'meta.function', 'entity', 'entity.name.function']
+        )
@@ -0,0 +1,97 @@
+"""Test scope prefix trie."""
+import unittest
+from lib.scope_selector import SelectorIndex, ScopeSelector
+from lib.scope_trie import ScopeTrie
+
+SELECTORS = [
+    'source',
+    'string',
+    'string.quoted.double',
+    'string - comment',
+    'comment string',
+    'meta.function entity.name',
+    'entity.name.function',
+    'source.python meta.function - meta.function.parameters',
+    '- comment',
+    'keyword.control, storage.type | constant',
+    '(meta & string) - source.js'
+]
+
+SCOPES = [
+    'source.python',
+    'source.python meta.function.python',
+    'source.python meta.function.python entity.name.function.python',
+    'source.python meta.function.python meta.function.parameters.python',
+    'source.python meta.function.python string.quoted.double.python',
+    'source.python comment.line.python',
+    'source.python comment.line.python string.quoted.double.python',
+    'source.js meta.function.js string.quoted.double.js',
+    'source.js keyword.control.js',
+    'source.js storage.type.js',
+    'text.plain'
+]
+
+
+class TestScopeTrie(unittest.TestCase):
+    """Test scope prefix trie."""
+
+    def setUp(self):
+        """Setup the trie."""
+
+        self.selectors = [ScopeSelector(s) for s in SELECTORS]
+        index = SelectorIndex()
+        for rule_id, selector in enumerate(SELECTORS):
+            index.add(rule_id, selector)
+        self.trie = ScopeTrie(index, lambda rule_id, scope, elements: self.selectors[rule_id].score(elements))
+
+    def full_scan(self, scope, score=None):
+        """Score every rule against the scope."""
+
+        if score is None:
+            score = self.trie.score
+        scores = []
+        for rule_id in range(len(self.selectors)):
+            match = score(rule_id, scope, scope.split())
+            if match:
+                scores.append((rule_id, match))
+        return scores
+
+    def test_matches_full_scan(self):
+        """Test that incremental scoring matches scoring every rule."""
+
+        for scope in SCOPES + list(reversed(SCOPES)):
+            self.assertEqual(self.trie.lookup(scope), self.full_scan(scope), scope)
+
+    def test_unbound_scores_depend_on_scope(self):
+        """Test that unbound rules match a full scan with a backend that scores them by the whole scope."""
+
+        unbound = self.trie.index.unbound
+
+        def score(rule_id, scope, elements):
+            """Score unbound rules by the depth of the scope."""
+
+            match = self.selectors[rule_id].score(elements)
+            return match * len(elements) if match and rule_id in unbound else match
+
+        self.assertTrue(unbound)
+        self.trie = ScopeTrie(self.trie.index, score)
+        for scope in SCOPES + list(reversed(SCOPES)):
+            self.assertEqual(self.trie.lookup(scope), self.full_scan(scope, score), scope)
+
+    def test_shared_prefixes(self):
+        """Test that prefixes are shared between scopes."""
+
+        self.trie.lookup('source.python meta.function.python entity.name.function.python')
+        self.assertEqual(self.trie.nodes, 4)
+        self.trie.lookup('source.python meta.function.python string.quoted.double.python')
+        self.assertEqual(self.trie.nodes, 5)
+
+    def test_bounded(self):
+        """Test that the trie starts over when full."""
+
+        self.trie.max_nodes = 4
+        self.trie.lookup('source.python meta.function.python entity.name.function.python')
+        self.trie.lookup('source.js keyword.control.js')
+        self.assertEqual(self.trie.nodes, 3)
+        scope = 'source.js keyword.control.js'
+        self.assertEqual(self.trie.lookup(scope), self.full_scan(scope))
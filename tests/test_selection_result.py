@@ -0,0 +1,107 @@
+"""Test selection result."""
+import unittest
+from collections import namedtuple
+from lib.selection_result import SelectionResult, is_transparent
+
+Colors = namedtuple(
+    'Colors', ['fg', 'fg_simulated', 'bg', 'bg_simulated', 'style', 'color_gradient', 'color_gradient_selector']
+)
+Selectors = namedtuple('Selectors', ['fg_selector', 'bg_selector', 'style_selectors', 'color_gradient_selector'])
+Selector = namedtuple('Selector', ['name', 'scope'])
+
+
+def make_result():
+    """Make a result showing everything."""
+
+    return SelectionResult(
+        'source.python string.quoted.python ',
+        points=(4, 9),
+        rowcol=(0, 4, 1, 0),
+        appearance=Colors('#11223380', '#111922', '#272822', '#272822', 'bold', [], None),
+        selectors=Selectors(
+            Selector('String', 'string'),
+            Selector('', 'source'),
+            {'bold': Selector('Bold', 'string.quoted'), 'italic': Selector('', '')},
+            None
+        ),
+        files=(
+            'Packages/Python/Python.sublime-syntax',
+            None,
+            ['Packages/User/A.sublime-color-scheme', 'Packages/User/B.sublime-color-scheme']
+        )
+    )
+
+
+class TestSelectionResult(unittest.TestCase):
+    """Test selection result."""
+
+    def test_transparent(self):
+        """Test transparent colors."""
+
+        self.assertTrue(is_transparent('#11223380'))
+        self.assertFalse(is_transparent('#112233FF'))
+        self.assertFalse(is_transparent('#112233'))
+
+    def test_scope_only(self):
+        """Test a result with only the scope shown."""
+
+        result = SelectionResult('source.python ')
+        self.assertEqual(result.entries(), [('copy-scope', 'Scope', 'source.python')])
+        self.assertEqual(result.text(), ['Scope:                         source.python', '------'])
+
+    def test_entries(self):
+        """Test the entries of a result showing everything."""
+
+        links = [link for link, label, value in make_result().entries()]
+        self.assertEqual(
+            links,
+            [
+                'copy-scope', 'copy-points', 'copy-line-char', 'copy-fg', 'copy-bg', 'copy-style',
+                'copy-fg-sel-name', 'copy-fg-sel-scope', 'copy-bg-sel-name', 'copy-bg-sel-scope',
+                'copy-bold-sel-name', 'copy-bold-sel-scope', 'copy-syntax', 'copy-overrides:1', 'copy-overrides:2'
+            ]
+        )
+
+    def test_simulated(self):
+        """Test simulated alpha colors are only included when enabled."""
+
+        result = make_result()
+        self.assertIsNone(result.lookup('copy-fg-sim'))
+        self.assertEqual(result.lookup('copy-fg-sim', True), ('Fg (Simulated Alpha)', '#111922'))
+        self.assertIsNone(result.lookup('copy-bg-sim', True))
+
+    def test_lookup(self):
+        """Test looking up the values copied by links."""
+
+        result = make_result()
+        self.assertEqual(result.lookup('copy-scope'), ('Scope', 'source.python string.quoted.python'))
+        self.assertEqual(result.lookup('copy-points'), ('Scope Extents (Pts)', '(4, 9)'))
+        self.assertEqual(
+            result.lookup('copy-line-char'), ('Scope Extents (Line/Char)', '(line: 1 char: 5, line: 2 char: 1)')
+        )
+        self.assertEqual(result.lookup('copy-overrides:2'), ('Scheme 2', 'Packages/User/B.sublime-color-scheme'))
+        self.assertIsNone(result.lookup('copy-scheme'))
+        self.assertIsNone(result.lookup('copy-italic-sel-name'))
+
+    def test_text(self):
+        """Test the text output."""
+
+        lines = make_result().text()
+        self.assertEqual(
+            lines[0],
+            'Scope:                         source.python\n'
+            '                               string.quoted.python'
+        )
+        self.assertEqual(lines[3], 'Fg:                            #11223380')
+        self.assertEqual(lines[-2], 'Scheme 2:                      Packages/User/B.sublime-color-scheme')
+        self.assertEqual(lines[-1], '------')
+
+    def test_count(self):
+        """Test the number of selections is shown for aggregated selections."""
+
+        result = SelectionResult('source.python ', count=3)
+        self.assertEqual(
+            result.text(),
+            ['Scope:                         source.python', 'Selections:                    3', '------']
+        )
+        self.assertEqual(result.entries(), [('copy-scope', 'Scope', 'source.python')])
@@ -0,0 +1,146 @@
+"""Test token index."""
+import unittest
+from lib.scope_extent import find_extent
+from lib.token_index import TokenIndex
+from .fake_view import View, char_tokens
+
+
+def make_view():
+    """Create a view of two lines."""
+
+    text = 'a "bc"\nd e\n'
+    scopes = (
+        ['source '] * 2 +
+        ['source string '] * 4 +
+        ['source '] * 2 +
+        ['source comment '] * 2 +
+        ['source ']
+    )
+    return View(char_tokens(text, scopes))
+
+
+class TestTokenIndex(unittest.TestCase):
+    """Test token index."""
+
+    def test_tokens(self):
+        """Test that tokens and scopes are found per line."""
+
+        index = TokenIndex(make_view())
+        self.assertEqual(index.token(3), (2, 6))
+        self.assertEqual(index.token(6), (6, 7))
+        self.assertEqual(index.token(8), (8, 10))
+        self.assertEqual(index.scope_name(4), 'source string ')
+        self.assertEqual(len(index.lines), 2)
+
+    def test_lookups_are_cached(self):
+        """Test that the view is asked once per line and once per scope and selector."""
+
+        view = make_view()
+        index = TokenIndex(view)
+        index.scope_name(0)
+        calls = sum(view.calls.values())
+        for pt in range(7):
+            index.scope_name(pt)
+            index.token(pt)
+        self.assertEqual(sum(view.calls.values()), calls)
+        self.assertTrue(index.match_selector(2, 'string'))
+        calls = sum(view.calls.values())
+        self.assertTrue(index.match_selector(5, 'string'))
+        self.assertEqual(sum(view.calls.values()), calls)
+
+    def test_extent(self):
+        """Test that extents found a token at a time match those found a character at a time."""
+
+        view = make_view()
+        index = TokenIndex(view)
+        for pt in range(view.size() + 1):
+            for selector in set(view.scopes):
+                self.assertEqual(
+                    find_extent(index, pt, selector, 100, index.token),
+                    find_extent(view, pt, selector, 100)
+                )
+        self.assertIsNone(find_extent(index, 4, 'source', 3, index.token))
+
+    def test_chunks(self):
+        """Test that extents found through chunks of long lines match those found a character at a time."""
+
+        view = make_view()
+        index = TokenIndex(view, chunk_size=3)
+        for pt in range(view.size() + 1):
+            for selector in set(view.scopes):
+                self.assertEqual(
+                    find_extent(index, pt, selector, 100, index.token),
+                    find_extent(view, pt, selector, 100)
+                )
+        self.assertTrue(all(line.end - line.begin <= 3 for line in index.lines))
+
+    def test_long_line(self):
+        """Test that a lookup in a long line only reads the scopes of the chunk around the point."""
+
+        tokens = []
+        for i in range(20000):
+            tokens.extend([('name', 'source variable '), ('(', 'source punctuation '), ('"s", ', 'source string ')])
+        view = View(tokens + [('\n', 'source ')])
+        index = TokenIndex(view)
+        pt = 150003
+        extent = find_extent(view, pt, view.scope_name(pt), 2000)
+        view.calls.clear()
+        self.assertEqual(find_extent(index, pt, index.scope_name(pt), 2000, index.token), extent)
+        self.assertEqual(view.calls['scope_name'], 256)
+        index.invalidate(pt)
+        view.calls.clear()
+        index.scope_name(pt + 1000)
+        self.assertEqual(view.calls['scope_name'], 256)
+
+    def test_invalidate(self):
+        """Test that lines from the modified point on are dropped."""
+
+        view = make_view()
+        index = TokenIndex(view)
+        index.token(0)
+        index.token(8)
+        view.edit(char_tokens('a "bc"\nde\n', view.scopes[:8] + view.scopes[9:]))
+        index.invalidate(8)
+        self.assertEqual([line.begin for line in index.lines], [0])
+        self.assertEqual(index.token(8), (8, 9))
+        index.sync()
+        self.assertEqual(len(index.lines), 2)
+
+    def test_sync(self):
+        """Test that all lines are dropped if the view changed without the index being told."""
+
+        view = make_view()
+        index = TokenIndex(view)
+        index.token(0)
+        view.edit([(view.text, 'source ')])
+        index.sync()
+        self.assertEqual(index.lines, [])
+        self.assertEqual(index.scope_name(3), 'source ')
+
+    def test_syntax_change(self):
+        """Test that all lines are dropped if the view's syntax changed."""
+
+        view = make_view()
+        index = TokenIndex(view)
+        index.token(0)
+        view.syntax = 'Packages/Other/Other.sublime-syntax'
+        view.scopes = ['text ' for scope in view.scopes]
+        index.sync()
+        self.assertEqual(index.lines, [])
+        self.assertEqual(index.scope_name(3), 'text ')
+
+    def test_verify(self):
+        """Test that lines indexed before the view finished lexing them are dropped once the point's scope changes."""
+
+        view = make_view()
+        index = TokenIndex(view)
+        index.token(0)
+        index.token(8)
+        index.verify(4, view.scope_name(4))
+        self.assertEqual(len(index.lines), 2)
+        view.scopes[2:6] = ['source comment '] * 4
+        index.verify(8, view.scope_name(8))
+        self.assertEqual(len(index.lines), 2)
+        index.verify(4, view.scope_name(4))
+        self.assertEqual(index.lines, [])
+        self.assertEqual(index.scope_name(4), 'source comment ')